@@ -0,0 +1,59 @@
+"""Baseline schema: users, books and reviews as first created by init_db
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("role", sa.String()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "books",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("author", sa.String(), nullable=False),
+        sa.Column("genre", sa.String()),
+        sa.Column("year_published", sa.Integer()),
+        sa.Column("summary", sa.Text()),
+    )
+    op.create_index("ix_books_id", "books", ["id"])
+    op.create_index("ix_books_title", "books", ["title"])
+    op.create_index("ix_books_author", "books", ["author"])
+    op.create_index("ix_books_genre", "books", ["genre"])
+
+    op.create_table(
+        "reviews",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("book_id", sa.Integer(), sa.ForeignKey("books.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("review_text", sa.Text(), nullable=False),
+        sa.Column("rating", sa.Float(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_reviews_id", "reviews", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("reviews")
+    op.drop_table("books")
+    op.drop_table("users")
@@ -0,0 +1,54 @@
+"""Book summary status, update time, full-text search vector and rating aggregates
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("books", sa.Column("summary_status", sa.String()))
+    op.add_column("books", sa.Column("updated_at", sa.DateTime()))
+    op.execute("UPDATE books SET summary_status = CASE WHEN summary IS NULL THEN 'pending' ELSE 'ready' END, "
+               "updated_at = CURRENT_TIMESTAMP")
+    op.create_index("ix_books_updated_at", "books", ["updated_at"])
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE books ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+                   "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                   "setweight(to_tsvector('english', coalesce(author, '')), 'B') || "
+                   "setweight(to_tsvector('english', coalesce(summary, '')), 'C')) STORED")
+        op.execute("CREATE INDEX ix_books_search_vector ON books USING GIN (search_vector)")
+
+    op.create_table(
+        "book_rating_stats",
+        sa.Column("book_id", sa.Integer(), sa.ForeignKey("books.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("review_count", sa.Integer(), nullable=False),
+        sa.Column("rating_sum", sa.Float(), nullable=False),
+        *(sa.Column(f"rating_{star}", sa.Integer(), nullable=False) for star in range(1, 6)),
+    )
+    # Same aggregation as review_services.reconcile_rating_stats
+    buckets = ", ".join(f"SUM(CASE WHEN ROUND(rating) = {star} THEN 1 ELSE 0 END)" for star in range(1, 6))
+    op.execute(
+        "INSERT INTO book_rating_stats (book_id, review_count, rating_sum, "
+        "rating_1, rating_2, rating_3, rating_4, rating_5) "
+        f"SELECT book_id, COUNT(*), SUM(rating), {buckets} FROM reviews GROUP BY book_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("book_rating_stats")
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX ix_books_search_vector")
+        op.drop_column("books", "search_vector")
+    op.drop_index("ix_books_updated_at", "books")
+    op.drop_column("books", "updated_at")
+    op.drop_column("books", "summary_status")
@@ -0,0 +1,25 @@
+"""Indexes for paginated review listings and per-user review lookups
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keyset pagination compares (created_at, id); give old rows without a timestamp one
+    op.execute("UPDATE reviews SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    op.create_index("ix_reviews_book_id_created_at_id", "reviews", ["book_id", "created_at", "id"])
+    op.create_index("ix_reviews_user_id", "reviews", ["user_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reviews_user_id", "reviews")
+    op.drop_index("ix_reviews_book_id_created_at_id", "reviews")
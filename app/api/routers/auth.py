@@ -1,34 +1,67 @@
+import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from jose import JWTError, jwt  #add
-from passlib.context import CryptContext  #add
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, event
+from sqlalchemy.orm import Session, object_session
 
 from app.db.session import get_db
 from app.models.models import User
 from app.schemas.schemas import UserCreate, UserOut, Token
 from app.config import settings
+from app.utility.local_cache import LocalCache, MISSING
+from app.utility.hashing import verify_password, get_password_hash, verify_password_async, get_password_hash_async
+from app.utility.redis_client import cache_get, cache_set, cache_delete
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 router = APIRouter()
 
+# Decoded JWT payloads by token, so repeated requests skip signature verification
+_token_cache = LocalCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL)
+# Strong references to scheduled cache evictions
+_eviction_tasks = set()
 
-def verify_password(plain_password, hashed_password):
-    """Verify a plain password against its hashed version."""
-    return pwd_context.verify(plain_password, hashed_password)
 
+def user_cache_key(user_id: int) -> str:
+    """Cache key of a user record."""
+    return f"user:{user_id}"
 
-def get_password_hash(password):
-    """Hash a plain password."""
-    return pwd_context.hash(password)
+
+async def invalidate_user(user_id: int):
+    """Drop a user from the auth caches (all workers)."""
+    await cache_delete(user_cache_key(user_id))
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _remember_changed_user(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    """Evict users changed by a transaction once it is committed."""
+    changed_user_ids = session.info.pop("changed_user_ids", ())
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Plain synchronous use (scripts); entries simply expire after AUTH_USER_CACHE_TTL
+        return
+    for user_id in changed_user_ids:
+        task = loop.create_task(invalidate_user(user_id))
+        _eviction_tasks.add(task)
+        task.add_done_callback(_eviction_tasks.discard)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -52,7 +85,8 @@ async def get_user_by_email(db: AsyncSession, email: str):
 
 async def create_user(db: AsyncSession, user_in: UserCreate):
     """Create a new user."""
-    user = User(email=user_in.email, hashed_password=get_password_hash(user_in.password), role=user_in.role)
+    user = User(email=user_in.email, hashed_password=await get_password_hash_async(user_in.password),
+                role=user_in.role)
     db.add(user)
     await db.commit()
     await db.refresh(user)
@@ -76,7 +110,7 @@ async def register(user_in: UserCreate, session: AsyncSession = Depends(get_db))
         raise HTTPException(status_code=400, detail="Username already taken")
 
     # Hash password
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash_async(user_in.password)
 
     # Create new user
     new_user = User(
@@ -97,27 +131,74 @@ async def register(user_in: UserCreate, session: AsyncSession = Depends(get_db))
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_db)):
     """Authenticate user and return JWT token."""
     user = await get_user_by_email(session, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Incorrect username or password',
                             headers={"WWW-Authenticate": "Bearer"})
-    token_data = {"sub": str(user.id), "role": user.role}
+    token_data = {"sub": str(user.id), "role": user.role, "email": user.email, "username": user.username}
     access_token = create_access_token(token_data)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_db)) -> User:
+def _decode_token(token: str) -> dict:
+    """Verify a JWT and return its payload, reusing recently verified payloads."""
+    payload = _token_cache.get(token)
+    if payload is MISSING:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        _token_cache.set(token, payload)
+    elif payload.get("exp") is not None and payload["exp"] <= time.time():
+        _token_cache.delete(token)
+        raise JWTError("Signature has expired.")
+    return payload
+
+
+async def _load_user(session: AsyncSession, payload: dict) -> Optional[User]:
+    """Resolve the user a token belongs to, from its claims or the user cache if possible."""
+    user_id = int(payload["sub"])
+    if settings.AUTH_TRUST_TOKEN_CLAIMS and "email" in payload and "username" in payload:
+        return User(id=user_id, email=payload["email"], username=payload["username"], role=payload.get("role"))
+
+    cached = await cache_get(user_cache_key(user_id))
+    if cached is not None:
+        return User(**cached)
+    user = await session.get(User, user_id)
+    if user is not None:
+        await cache_set(user_cache_key(user_id),
+                        {"id": user.id, "username": user.username, "email": user.email, "role": user.role},
+                        ttl=settings.AUTH_USER_CACHE_TTL, notify=False)
+    return user
+
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme),
+                           session: AsyncSession = Depends(get_db)) -> User:
     """Get the current authenticated user from the JWT token."""
+    # Resolve the user only once per request, however many dependencies ask for it
+    current_user = getattr(request.state, "current_user", None)
+    if current_user is not None:
+        return current_user
+
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                           detail="Could not validate credentials",
                                           headers={"WWW-Authenticate": "Bearer"})
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        payload = _decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = await session.get(User, int(user_id))
+    user = await _load_user(session, payload)
     if user is None:
         raise credentials_exception
+    request.state.current_user = user
     return user
+
+
+async def get_optional_user(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme),
+                            session: AsyncSession = Depends(get_db)) -> Optional[User]:
+    """Get the current user if the request carries a valid token, None for anonymous requests."""
+    if token is None:
+        return None
+    try:
+        return await get_current_user(request, token, session)
+    except HTTPException:
+        return None
@@ -1,17 +1,25 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.schemas.schemas import BookCreate, BookOut
+from app.schemas.schemas import BookCreate, BookImportOut, BookOut, SimilarBookOut, SummaryStatusOut
 from app.services.book_services import (
+    book_etag,
     create_book,
     get_book_by_id,
     update_book,
-    delete_book
+    delete_book,
+    get_similar_books,
+    import_books,
+    search_books
 )
 from app.api.routers.auth import get_current_user
 from app.db.session import get_db
-from app.services.ai_service import summarize_text
+from app.config import settings
+from app.services.summary_jobs import enqueue_summary, enqueue_summaries
+from app.utility.bulk_import import FORMATS, detect_format, iter_records
+from app.utility.etag import etag_matches, not_modified
 from app.services.book_services import get_all_books
 
 # Configure logging
@@ -24,40 +32,102 @@ router = APIRouter(dependencies=[Depends(get_current_user)])
 # POST /books - add a new book
 @router.post("/", response_model=BookOut)
 async def add_book(book_data: BookCreate, db: AsyncSession = Depends(get_db)):
-    """Create a new book entry (basic version without AI summary)."""
+    """Create a new book entry; a missing summary is generated in the background."""
     book = await create_book(db, book_data)
     logger.info(f"Book '{book.title}' by {book.author} created with ID {book.id}")
-    if not book.summary:
-        # call llama to generate summary based on title+author (or full content if provided)
-        prompt = f"Write a short summary for the book titled '{book.title}' by {book.author}."
-        summary = await summarize_text(prompt)
-        book.summary = summary
-        db.add(book)
-        await db.commit()
-        await db.refresh(book)
+    if book.summary_status == "pending":
+        await enqueue_summary(book.id)
     return book
 
 
-# GET /books - retrieve all books
+# POST /books/import - bulk import from a CSV or JSON Lines file
+@router.post("/import", response_model=BookImportOut)
+async def import_books_endpoint(file: UploadFile = File(...),
+                                format: Optional[str] = Query(None, description="csv or jsonl; "
+                                                              "guessed from the file name if omitted"),
+                                db: AsyncSession = Depends(get_db)):
+    """Import many books at once; rows without a summary get one generated in the background."""
+    fmt = format or detect_format(file.filename)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail="Unknown file format, expected csv or jsonl")
+    report, pending_ids = await import_books(db, iter_records(file.file, fmt), settings.IMPORT_BATCH_SIZE)
+    await enqueue_summaries(pending_ids)
+    logger.info(f"Imported {report['imported']} books from {file.filename} ({report['failed']} rows rejected)")
+    return report
+
+
+def json_page(body: str, next_cursor: Optional[str]) -> Response:
+    """Send a page serialized by the book services as is, skipping response_model validation."""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# GET /books - retrieve books page by page
 @router.get("/", response_model=list[BookOut])
-async def list_books(db: AsyncSession = Depends(get_db)):
-    """Retrieve all books from the database."""
-    books = await get_all_books(db)
-    logger.info(f"Retrieved {len(books)} books from the database")
-    return books
+async def list_books(after: Optional[str] = None,
+                     limit: int = Query(settings.BOOKS_PAGE_SIZE, ge=1, le=settings.BOOKS_PAGE_MAX),
+                     db: AsyncSession = Depends(get_db)):
+    """Retrieve a page of books; the next page's cursor is returned in the X-Next-Cursor header."""
+    try:
+        body, next_cursor = await get_all_books(db, after=after, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    logger.info(f"Retrieved a page of up to {limit} books")
+    return json_page(body, next_cursor)
+
+
+# GET /books/search - full-text search, best match first
+@router.get("/search", response_model=list[BookOut])
+async def search(q: str = Query(..., min_length=1, max_length=200),
+                 after: Optional[str] = None,
+                 limit: int = Query(settings.BOOKS_PAGE_SIZE, ge=1, le=settings.BOOKS_PAGE_MAX),
+                 db: AsyncSession = Depends(get_db)):
+    """Search books by title, author and summary; the next page's cursor is returned in the X-Next-Cursor header."""
+    try:
+        body, next_cursor = await search_books(db, q, after=after, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    logger.info(f"Searched books for {q!r}")
+    return json_page(body, next_cursor)
 
 
 # GET /books/{id} - retrieve a specific book by its ID
 @router.get("/{book_id}", response_model=BookOut)
-async def get_book(book_id: int, db: AsyncSession = Depends(get_db)):
-    """Retrieve a specific book by its ID."""
+async def get_book(book_id: int, response: Response, if_none_match: Optional[str] = Header(None),
+                   db: AsyncSession = Depends(get_db)):
+    """Retrieve a specific book by its ID (304 when If-None-Match holds its current ETag)."""
     book = await get_book_by_id(db, book_id)
     logger.info(f"Retrieved book with ID {book_id}")
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
+    etag = book_etag(book)
+    if etag:
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
     return book
 
 
+# GET /books/{id}/summary-status - check on a book's background summary
+@router.get("/{book_id}/summary-status", response_model=SummaryStatusOut)
+async def get_summary_status(book_id: int, db: AsyncSession = Depends(get_db)):
+    """Retrieve the state of a book's background summary generation."""
+    book = await get_book_by_id(db, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return {"book_id": book["id"], "summary_status": book["summary_status"], "summary": book["summary"]}
+
+
+# GET /books/{id}/similar - books with similar content
+@router.get("/{book_id}/similar", response_model=list[SimilarBookOut])
+async def similar_books(book_id: int, limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_db)):
+    """Retrieve the books most similar to a book by title, author, genre and summary."""
+    book = await get_book_by_id(db, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return await get_similar_books(db, book_id, limit)
+
+
 # PUT /books/{id} - update a book's information by its ID
 @router.put("/{book_id}", response_model=BookOut)
 async def update_book_endpoint(book_id: int, book_data: BookCreate, db: AsyncSession = Depends(get_db)):
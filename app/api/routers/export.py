@@ -0,0 +1,43 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.routers.auth import get_current_user
+from app.db.session import get_db
+from app.services.export_services import stream_books, stream_reviews, gzip_stream
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+def _ndjson_response(chunks, name: str, gzip: bool) -> StreamingResponse:
+    headers = {"Content-Disposition": f'attachment; filename="{name}.ndjson"'}
+    if gzip:
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+
+# GET /export/books - stream the catalog as NDJSON
+@router.get("/books")
+async def export_books(updated_since: Optional[datetime] = None, gzip: bool = False,
+                       db: AsyncSession = Depends(get_db)):
+    """Stream every book, or those changed since `updated_since`, one JSON object per line."""
+    logger.info(f"Exporting books updated since {updated_since}")
+    return _ndjson_response(stream_books(db, updated_since), "books", gzip)
+
+
+# GET /export/reviews - stream all reviews as NDJSON
+@router.get("/reviews")
+async def export_reviews(updated_since: Optional[datetime] = None, gzip: bool = False,
+                         db: AsyncSession = Depends(get_db)):
+    """Stream every review, or those posted since `updated_since`, one JSON object per line."""
+    logger.info(f"Exporting reviews posted since {updated_since}")
+    return _ndjson_response(stream_reviews(db, updated_since), "reviews", gzip)
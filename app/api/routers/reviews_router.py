@@ -1,12 +1,25 @@
 import logging
+from contextlib import aclosing
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Literal, Optional
 
+from app.config import settings
 from app.db.session import get_db
 from app.schemas.schemas import ReviewCreate, ReviewOut
-from app.services.review_services import get_reviews, get_book_summary, add_review
+from app.services.review_services import (
+    get_reviews,
+    get_book_summary,
+    get_book_overview,
+    stream_review_summary,
+    add_review
+)
+from app.services.ai_service import CHATGROQ_ERROR
+from app.services.book_services import fetch_book_version, get_book_by_id, reviews_etag
+from app.utility.etag import etag_matches, not_modified
+from app.utility.sse import sse_event
 from app.api.routers.auth import get_current_user
 from app.models.models import User
 
@@ -29,15 +42,65 @@ async def create_review(book_id: int, review: ReviewCreate, current_user: User =
 
 
 @router.get("/{book_id}/reviews", response_model=List[ReviewOut])
-async def list_reviews(book_id: int, db: AsyncSession = Depends(get_db)):
-    """Retrieve all reviews for a specific book."""
+async def list_reviews(book_id: int,
+                       response: Response,
+                       sort: Literal["recent", "rating"] = "recent",
+                       after: Optional[str] = None,
+                       limit: int = Query(settings.REVIEWS_PAGE_SIZE, ge=1, le=settings.REVIEWS_PAGE_MAX),
+                       if_none_match: Optional[str] = Header(None),
+                       db: AsyncSession = Depends(get_db)):
+    """Retrieve a page of a book's reviews, newest (or best rated) first.
+
+    The next page's cursor is returned in the X-Next-Cursor header; it is only valid with the same sort.
+    Pages carry the book's version as ETag, so an unchanged page is answered with 304 before any review is read.
+    """
     logger.info(f"Retrieving reviews for book ID {book_id}")
-    return await get_reviews(book_id, db)
+    book = await get_book_by_id(db, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    cached_etag = reviews_etag(book)
+    if cached_etag and etag_matches(if_none_match, cached_etag):
+        return not_modified(cached_etag)
+    # The cached version is written from the primary and may be ahead of a lagging replica, so the
+    # page is tagged with the version read in its own session, before it
+    etag = reviews_etag({"id": book_id, "version": await fetch_book_version(db, book_id)})
+    try:
+        reviews, next_cursor = await get_reviews(book_id, db, sort=sort, after=after, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if etag:
+        response.headers["ETag"] = etag
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return reviews
 
 
 @router.get("/{book_id}/summary")
-async def book_summary(book_id: int, db: AsyncSession = Depends(get_db)):
-    """Get AI-generated summary of reviews and aggregated rating for a specific book."""
+async def book_summary(book_id: int, stream: bool = False, db: AsyncSession = Depends(get_db)):
+    """Get AI-generated summary of reviews and aggregated rating for a specific book.
+
+    With ?stream=true the response is server-sent events: a "rating" event with the aggregated
+    rating first, then "token" events as the review summary is generated, then "done".
+    """
+    if stream:
+        overview = await get_book_overview(book_id, db)
+        # Admitted before the response starts, so a lack of capacity is still a 429/503; the reviews
+        # are only read once the rating is on its way, so the first byte never waits for them
+        pieces = await stream_review_summary(book_id, db)
+
+        async def events():
+            yield sse_event("rating", overview)
+            try:
+                async with aclosing(pieces):
+                    async for piece in pieces:
+                        yield sse_event("token", {"text": piece})
+            except Exception as e:
+                yield sse_event("error", {"detail": f"{CHATGROQ_ERROR} {e}"})
+            yield sse_event("done", {})
+
+        logger.info(f"Streaming AI-generated summary for book ID {book_id}")
+        return StreamingResponse(events(), media_type="text/event-stream")
+
     summary = await get_book_summary(book_id, db)
     logger.info(f"Retrieving AI-generated summary for book ID {book_id}")
     if summary is None:
@@ -0,0 +1,82 @@
+"""Maintenance commands.
+
+Usage:
+    python -m app.cli reconcile-ratings [--book-id ID]
+    python -m app.cli backfill-summaries
+    python -m app.cli import-books FILE [--format csv|jsonl] [--no-summaries]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.db.base import SessionLocal, engine
+from app.config import settings
+from app.services.book_services import import_books
+from app.services.review_services import reconcile_rating_stats
+from app.services.summary_jobs import enqueue_missing_summaries, enqueue_summaries
+from app.utility.bulk_import import FORMATS, detect_format, iter_records
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def reconcile_ratings(book_id=None):
+    """Rebuild the rating aggregates from the reviews table."""
+    async with SessionLocal() as session:
+        count = await reconcile_rating_stats(session, book_id)
+    await engine.dispose()
+    logger.info(f"Rebuilt rating aggregates for {count} book(s)")
+
+
+async def backfill_summaries():
+    """Queue background summary generation for every book without a summary."""
+    async with SessionLocal() as session:
+        count = await enqueue_missing_summaries(session)
+    await engine.dispose()
+    logger.info(f"Queued {count} book(s) for summary generation")
+
+
+async def import_books_file(path, fmt, queue_summaries=True):
+    """Bulk import books from a CSV or JSON Lines file."""
+    with open(path, "rb") as stream:
+        async with SessionLocal() as session:
+            report, pending_ids = await import_books(session, iter_records(stream, fmt), settings.IMPORT_BATCH_SIZE)
+    if queue_summaries:
+        await enqueue_summaries(pending_ids)
+    await engine.dispose()
+    for error in report["errors"]:
+        logger.warning(f"Row {error['row']}: {error['error']}")
+    logger.info(f"Imported {report['imported']} book(s), rejected {report['failed']} row(s), "
+                f"{report['pending_summaries']} book(s) awaiting a summary")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Book Manager maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reconcile = commands.add_parser("reconcile-ratings", help="Rebuild rating aggregates from the reviews table")
+    reconcile.add_argument("--book-id", type=int, default=None, help="Only rebuild this book's aggregate")
+
+    commands.add_parser("backfill-summaries", help="Queue summary generation for books without a summary")
+
+    import_parser = commands.add_parser("import-books", help="Bulk import books from a CSV or JSON Lines file")
+    import_parser.add_argument("file", help="Path of the .csv, .jsonl or .ndjson file")
+    import_parser.add_argument("--format", choices=FORMATS, default=None,
+                               help="Override the format guessed from the file name")
+    import_parser.add_argument("--no-summaries", action="store_true",
+                               help="Do not queue summary generation (run backfill-summaries later)")
+
+    args = parser.parse_args(argv)
+    if args.command == "reconcile-ratings":
+        asyncio.run(reconcile_ratings(args.book_id))
+    elif args.command == "backfill-summaries":
+        asyncio.run(backfill_summaries())
+    elif args.command == "import-books":
+        fmt = args.format or detect_format(args.file)
+        if fmt is None:
+            parser.error("cannot tell the file format from its name, pass --format")
+        asyncio.run(import_books_file(args.file, fmt, not args.no_summaries))
+
+
+if __name__ == "__main__":
+    main()
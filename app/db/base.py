@@ -2,9 +2,20 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, Asyn
 from sqlalchemy.orm import declarative_base
 
 from app.config import settings
+from app.utility import sql_profiler
 
 DATABASE_URL = settings.get_database_url()
 
+
+class RoutedSession(AsyncSession):
+    """AsyncSession that awaits the callbacks in info["after_commit"] once a commit succeeds."""
+
+    async def commit(self):
+        await super().commit()
+        for callback in self.info.get("after_commit", ()):
+            await callback()
+
+
 engine = create_async_engine(
     DATABASE_URL, 
     echo=settings.DEBUG,
@@ -12,13 +23,28 @@ engine = create_async_engine(
     pool_pre_ping=True,
     pool_recycle=300
 )
+sql_profiler.instrument(engine)
 
 SessionLocal = async_sessionmaker(
     bind=engine,
-    class_=AsyncSession,
+    class_=RoutedSession,
     expire_on_commit=False,
     autoflush=True,
     autocommit=False
 )
 
+# Read replicas, used by GET requests through app.db.session.get_db
+replica_engines = [
+    create_async_engine(url, echo=settings.DEBUG, future=True, pool_pre_ping=True, pool_recycle=300)
+    for url in settings.get_replica_urls()
+]
+for replica_engine in replica_engines:
+    sql_profiler.instrument(replica_engine)
+
+ReplicaSessionLocals = [
+    async_sessionmaker(bind=replica_engine, class_=RoutedSession, expire_on_commit=False, autoflush=True,
+                       autocommit=False)
+    for replica_engine in replica_engines
+]
+
 Base = declarative_base()
@@ -1,11 +1,114 @@
-from sqlalchemy.ext.asyncio import AsyncSession
+import hashlib
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
-from app.db.base import SessionLocal
+from fastapi import Request
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
 
+from app.config import settings
+from app.db.base import SessionLocal, ReplicaSessionLocals
+from app.utility import redis_client
 
-async def get_db() -> AsyncSession:
-    """Dependency for getting async database sessions."""
-    async with SessionLocal() as session:
+logger = logging.getLogger(__name__)
+
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadOnlySessionError(RuntimeError):
+    """A session bound to a read replica was asked to write."""
+
+
+@event.listens_for(Session, "before_flush")
+def _reject_replica_writes(session, flush_context, instances):
+    if session.info.get("read_only") and (session.new or session.dirty or session.deleted):
+        raise ReadOnlySessionError("Cannot write through a read replica session")
+
+
+class SessionRouter:
+    """Chooses the database each request's session is bound to.
+
+    Reads (GET/HEAD/OPTIONS) go to the replicas in turn and everything else to the primary.
+    A client that has just committed keeps reading from the primary for `sticky_seconds`,
+    so it always sees its own writes despite replication lag. The marker lives in Redis,
+    so it holds across workers.
+    """
+
+    def __init__(self, primary: async_sessionmaker, replicas: list[async_sessionmaker], sticky_seconds: float):
+        self.primary = primary
+        self.replicas = replicas
+        self.sticky_seconds = sticky_seconds
+        self._turn = itertools.count()
+
+    @staticmethod
+    def client_keys(request: Request) -> list[str]:
+        """Sticky-marker keys of a request's client: its bearer token (if any), then its address."""
+        keys = []
+        authorization = request.headers.get("authorization")
+        if authorization:
+            keys.append("db:sticky:token:" + hashlib.sha256(authorization.encode()).hexdigest()[:32])
+        if request.client:
+            keys.append(f"db:sticky:addr:{request.client.host}")
+        return keys
+
+    async def stick(self, request: Request):
+        """Pin the request's client to the primary for the next `sticky_seconds`."""
+        keys = self.client_keys(request)
+        if not self.replicas or not keys:
+            return
+        try:
+            await redis_client.redis.set(keys[0], 1, px=int(self.sticky_seconds * 1000))
+        except RedisError as e:
+            logger.warning(f"Could not record read-your-writes marker: {e}")
+
+    async def is_sticky(self, request: Request) -> bool:
+        """Whether the request's client committed within the last `sticky_seconds`."""
+        keys = self.client_keys(request)
+        if not keys:
+            return False
+        try:
+            return any(await redis_client.redis.mget(keys))
+        except RedisError:
+            # Without the marker we cannot tell, and the primary is always correct
+            return True
+
+    async def sessionmaker_for(self, request: Request) -> tuple[async_sessionmaker, bool]:
+        """Session factory for a request, and whether it is a read replica."""
+        if not self.replicas or request.method not in READ_METHODS or await self.is_sticky(request):
+            return self.primary, False
+        return self.replicas[next(self._turn) % len(self.replicas)], True
+
+
+db_router = SessionRouter(SessionLocal, ReplicaSessionLocals, settings.DATABASE_STICKY_SECONDS)
+
+
+@asynccontextmanager
+async def primary_session(db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """The given session, or a fresh primary session if it reads from a replica.
+
+    Shared caches must be filled from the primary: a page read from a lagging replica right after
+    a write would be stored under the new cache version and served to everyone until it expires.
+    """
+    if not db.info.get("read_only"):
+        yield db
+        return
+    async with db_router.primary() as session:
+        yield session
+
+
+async def get_db(request: Request) -> AsyncSession:
+    """Dependency for getting async database sessions, routed to the primary or a read replica."""
+    factory, read_only = await db_router.sessionmaker_for(request)
+    async with factory() as session:
+        if read_only:
+            session.info["read_only"] = True
+        else:
+            # Runs inside commit(), before the response is sent, so the client's next read is already pinned
+            session.info["after_commit"] = [lambda: db_router.stick(request)]
         try:
             yield session
         finally:
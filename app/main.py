@@ -1,18 +1,41 @@
-from contextlib import asynccontextmanager
+import asyncio
+import json
+import math
+from collections import defaultdict
+from contextlib import aclosing, asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.future import select
+from typing import Optional
 import logging
 
 from app.db.base import Base
 from app.api.routers.books import router as books_router
 from app.api.routers.reviews_router import router as reviews_router
 from app.api.routers.auth import router as auth_router
+from app.api.routers.export import router as export_router
 from app.config import settings
-from app.models.models import Book
+from app.models.models import User
+from app.schemas.schemas import SummaryBatchRequest
 from app.db.session import get_db
-from app.services.ai_service import summarize_text
+from app.services.ai_service import (
+    summarize_text,
+    summarize_many,
+    stream_summary,
+    llm_cache_stats,
+    SUMMARIZATION_ERROR
+)
+from app.utility.sse import sse_event
+from app.utility.hashing import hash_pool_stats, shutdown_hash_pool
+from app.services.summary_jobs import run_summary_workers
+from app.services.recommendation_services import get_recommendations, run_recommender_refresh
+from app.services.similarity_index import similarity_index, run_similarity_refresh, run_similarity_sync
+from app.api.routers.auth import get_optional_user
+from app.utility import redis_client
+from app.utility.metrics import MetricsMiddleware, render_metrics
+from app.utility.sql_profiler import SqlProfilerMiddleware, recent_profiles
+from app.utility.rate_limiter import CapacityExhausted
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -40,11 +63,27 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Book Manager API with lifespan...")
     # Init database
     await init_db()
+    # Keep the in-process cache tier and similarity index coherent with the other workers
+    invalidation_task = asyncio.create_task(redis_client.listen_for_invalidations())
+    # Generate missing book summaries off the request path
+    summary_workers_task = asyncio.create_task(run_summary_workers())
+    recommender_task = asyncio.create_task(run_recommender_refresh())
+    similarity_task = asyncio.create_task(run_similarity_refresh())
+    similarity_sync_task = asyncio.create_task(run_similarity_sync())
     logger.info("Book Manager API started successfully")
     # Yield control to the application
     yield
     # ----------------- SHUTDOWN -----------------
     logger.info("Shutting down Book Manager API...")
+    summary_workers_task.cancel()
+    recommender_task.cancel()
+    similarity_task.cancel()
+    similarity_sync_task.cancel()
+    # Persist incremental updates so the next worker starts warm
+    if similarity_index.built and settings.SIMILARITY_INDEX_DIR:
+        similarity_index.save()
+    invalidation_task.cancel()
+    shutdown_hash_pool()
     logger.info("Shutdown complete.")
 
 
@@ -55,6 +94,16 @@ app = FastAPI(
     debug=settings.DEBUG,
     lifespan=lifespan
 )
+app.add_middleware(SqlProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(CapacityExhausted)
+async def llm_capacity_exhausted(request, exc: CapacityExhausted):
+    """429 when the shared LLM rate budget is spent, 503 when every call slot is busy; never an error string."""
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
 
 # Create a separate router for root-level endpoints
 root_router = APIRouter()
@@ -62,34 +111,59 @@ root_router = APIRouter()
 
 @app.get("/recommendations")
 async def recommendations(genre: str = None, author: str = None, limit: int = 10,
-                          session: AsyncSession = Depends(get_db)):
-    """Get book recommendations based on user preferences."""
-    q = select(Book)
-    if genre:
-        q = q.where(Book.genre == genre)
-    if author:
-        q = q.where(Book.author == author)
-    q = q.limit(limit)
-    resp = await session.execute(q)
-    books = resp.scalars().all()
-    return books
+                          session: AsyncSession = Depends(get_db),
+                          current_user: Optional[User] = Depends(get_optional_user)):
+    """Get ranked book recommendations, personalized from the reviews of the signed-in user."""
+    user_id = current_user.id if current_user else None
+    return await get_recommendations(session, user_id, genre, author, limit)
 
 
 @app.post("/generate-summary")
-async def generate_summary(content: dict):
-    """Generate a summary for a given book content."""
+async def generate_summary(content: dict, stream: bool = False):
+    """Generate a summary for a given book content (as server-sent "token" events with ?stream=true)."""
     text = content.get("text")
     if not text:
         raise HTTPException(status_code=400, detail="Missing 'text' in payload")
+    if stream:
+        # Admitted before the response starts, so a lack of capacity is still a 429/503
+        pieces = await stream_summary(text)
+
+        async def events():
+            try:
+                async with aclosing(pieces):
+                    async for piece in pieces:
+                        yield sse_event("token", {"text": piece})
+            except Exception as e:
+                yield sse_event("error", {"detail": f"{SUMMARIZATION_ERROR} {e}"})
+            yield sse_event("done", {})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
     summary = await summarize_text(text)
     return {"summary": summary}
 
 
+@app.post("/generate-summary/batch")
+async def generate_summary_batch(payload: SummaryBatchRequest):
+    """Summarize many texts, streaming one NDJSON line per input as soon as its summary is ready."""
+    # Identical texts are summarized once and answered for every position they appear at
+    positions = defaultdict(list)
+    for index, text in enumerate(payload.texts):
+        positions[text].append(index)
+
+    async def results():
+        async for text, summary in summarize_many(list(positions), settings.SUMMARY_BATCH_CONCURRENCY):
+            for index in positions[text]:
+                yield json.dumps({"index": index, "summary": summary}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 # Include the routers
 app.include_router(root_router)
 app.include_router(books_router, prefix="/books", tags=["Books"])
 app.include_router(reviews_router, prefix="/books", tags=["Reviews"])
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
+app.include_router(export_router, prefix="/export", tags=["Export"])
 
 
 @app.get("/health_check")
@@ -103,6 +177,33 @@ async def health_check():
     }
 
 
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit, miss and eviction counts of each cache tier in this worker."""
+    return {**redis_client.cache_stats(), "llm": llm_cache_stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics: route latency, database queries, cache lookups and LLM calls."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/debug/sql-profiles", include_in_schema=False)
+async def sql_profiles(limit: int = 20):
+    """Statements, timings and repeated queries of the latest requests (only with SQL_PROFILING on)."""
+    if not settings.SQL_PROFILING:
+        raise HTTPException(status_code=404, detail="SQL profiling is disabled")
+    return list(recent_profiles)[-limit:][::-1]
+
+
+@app.get("/hash-pool-stats")
+async def password_hash_pool_stats():
+    """Queue depth and throughput of the password hashing worker pool."""
+    return hash_pool_stats()
+
+
 if __name__ == "__main__":
     import uvicorn
 
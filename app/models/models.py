@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Float, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Float, DateTime, DDL, Index, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -26,10 +26,19 @@ class Book(Base):
     genre = Column(String, index=True)
     year_published = Column(Integer)
     summary = Column(Text)
+    # "pending" while a summary is being generated in the background, then "ready" or "failed"
+    summary_status = Column(String, default="ready")
+    # Last write to the row, for incremental exports
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Bumped by every change to the book or its reviews; the ETag of both resources
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     reviews = relationship("Review", back_populates="book",
                            cascade="all, delete, delete-orphan",
                            passive_deletes=True)
+    rating_stats = relationship("BookRatingStats", back_populates="book", uselist=False,
+                                cascade="all, delete, delete-orphan",
+                                passive_deletes=True)
 
     def to_dict(self):
         """Convert Book object to dictionary."""
@@ -39,15 +48,35 @@ class Book(Base):
             "author": self.author,
             "genre": self.genre,
             "year_published": self.year_published,
-            "summary": self.summary
+            "summary": self.summary,
+            "summary_status": self.summary_status
         }
 
 
+# Full-text search vector of a book, maintained by Postgres itself (generated column, GIN indexed).
+# It is left out of the mapped columns so SQLite test databases, which search in process, still work.
+BOOK_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(summary, '')), 'C')"
+)
+event.listen(Book.__table__, "after_create", DDL(
+    f"ALTER TABLE books ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({BOOK_SEARCH_VECTOR}) STORED"
+).execute_if(dialect="postgresql"))
+event.listen(Book.__table__, "after_create", DDL(
+    "CREATE INDEX ix_books_search_vector ON books USING GIN (search_vector)"
+).execute_if(dialect="postgresql"))
+
+
 class Review(Base):
     __tablename__ = "reviews"
+    __table_args__ = (
+        # Serves a book's review pages newest first, as keyset (created_at DESC, id DESC)
+        Index("ix_reviews_book_id_created_at_id", "book_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), nullable=False)
     review_text = Column(Text, nullable=False)
     rating = Column(Float, nullable=False)
@@ -55,3 +84,27 @@ class Review(Base):
 
     user = relationship("User", back_populates="reviews")
     book = relationship("Book", back_populates="reviews")
+
+
+class BookRatingStats(Base):
+    """Denormalized rating aggregate of a book, kept up to date by add_review."""
+    __tablename__ = "book_rating_stats"
+
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0)
+    rating_1 = Column(Integer, nullable=False, default=0)
+    rating_2 = Column(Integer, nullable=False, default=0)
+    rating_3 = Column(Integer, nullable=False, default=0)
+    rating_4 = Column(Integer, nullable=False, default=0)
+    rating_5 = Column(Integer, nullable=False, default=0)
+
+    book = relationship("Book", back_populates="rating_stats")
+
+    def average(self):
+        """Average rating, or None if there are no reviews."""
+        return self.rating_sum / self.review_count if self.review_count else None
+
+    def histogram(self):
+        """Number of reviews per star rating (1-5)."""
+        return {str(star): getattr(self, f"rating_{star}") for star in range(1, 6)}
@@ -1,5 +1,8 @@
+from datetime import datetime
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import Annotated, Optional
+
+from app.config import settings
 
 
 class BookCreate(BaseModel):
@@ -14,11 +17,44 @@ class BookCreate(BaseModel):
 class BookOut(BookCreate):
     """Schema for outputting book details"""
     id: int
+    summary_status: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class SimilarBookOut(BookOut):
+    """Schema for outputting a book together with its content similarity score"""
+    similarity: float
+
+
+class ImportRowErrorOut(BaseModel):
+    """Schema for outputting why one row of a bulk import was rejected"""
+    row: int
+    error: str
+
+
+class BookImportOut(BaseModel):
+    """Schema for outputting the result of a bulk import"""
+    imported: int
+    failed: int
+    pending_summaries: int
+    errors: list[ImportRowErrorOut]
+
+
+class SummaryStatusOut(BaseModel):
+    """Schema for outputting the state of a book's background summary"""
+    book_id: int
+    summary_status: Optional[str]
+    summary: Optional[str]
+
+
+class SummaryBatchRequest(BaseModel):
+    """Schema for summarizing several texts in one request"""
+    texts: list[Annotated[str, Field(min_length=1)]] = Field(..., min_length=1,
+                                                             max_length=settings.SUMMARY_BATCH_MAX_ITEMS)
+
+
 class ReviewCreate(BaseModel):
     """Schema for creating a new review"""
     review_text: str = Field(...)
@@ -28,6 +64,7 @@ class ReviewCreate(BaseModel):
 class ReviewOut(ReviewCreate):
     """Schema for outputting review details"""
     id: int
+    created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -1,44 +1,309 @@
+import asyncio
+import hashlib
+import json
 import logging
+import time
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
-from langchain_core.messages import HumanMessage, SystemMessage
+import groq
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_groq import ChatGroq
 from app.config import settings
-llm = ChatGroq(model="llama-3.1-8b-instant",
+from app.utility.redis_client import cache_get, cache_set_bounded
+from app.utility.metrics import LLM_ERRORS, LLM_REJECTED, LLM_REQUEST_DURATION
+from app.utility.rate_limiter import CapacityExhausted, LLMGovernor, RateLimitExceeded
+llm = ChatGroq(model=settings.LLM_MODEL,
                api_key=settings.GROQ_API_KEY)
+governor = LLMGovernor("llm:ratelimit", settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE,
+                       settings.LLM_MAX_CONCURRENCY)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+
+LLM_CACHE_INDEX = "llm:index"
+SUMMARIZATION_ERROR = "[SUMMARIZATION ERROR]"
+CHATGROQ_ERROR = "[CHATGROQ ERROR]"
+_llm_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _cache_key(messages: list[BaseMessage], max_tokens: int, temperature: Optional[float]) -> str:
+    """Content-addressed cache key of an LLM call."""
+    payload = json.dumps({
+        "model": settings.LLM_MODEL,
+        "messages": [[message.type, message.content] for message in messages],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }, sort_keys=True)
+    return f"llm:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+def _estimate_tokens(messages: list[BaseMessage], max_tokens: int) -> int:
+    """Tokens a call counts against the quota: the prompt (about 4 characters per token) plus the completion budget."""
+    return sum(len(message.content) for message in messages) // 4 + max_tokens
+
+
+def _retry_after(error: groq.RateLimitError) -> float:
+    try:
+        return float(error.response.headers.get("retry-after", 1))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+
+def _queue_timeout(queue_timeout: Optional[float]) -> float:
+    return queue_timeout if queue_timeout is not None else settings.LLM_QUEUE_TIMEOUT
+
+
+@asynccontextmanager
+async def _counting_rejections():
+    """Count CapacityExhausted errors raised in the block by their type."""
+    try:
+        yield
+    except CapacityExhausted as e:
+        LLM_REJECTED.labels(type(e).__name__).inc()
+        raise
+
+
+@asynccontextmanager
+async def _reserved(tokens: int, queue_timeout: Optional[float]):
+    """Hold an LLM call slot and `tokens` of rate budget for the duration of the block.
+
+    Raises CapacityExhausted (never a provider error string) when there is no capacity in time.
+    """
+    async with _counting_rejections(), governor.slot(tokens, _queue_timeout(queue_timeout)):
+        yield
+
+
+@asynccontextmanager
+async def _timed_call(operation: str):
+    """Time the LLM call made in the block and count its errors."""
+    started = time.perf_counter()
+    try:
+        yield
+    except groq.RateLimitError as e:
+        LLM_ERRORS.labels(operation).inc()
+        # Our budget is out of step with the provider's: make every worker back off
+        await governor.penalize(_retry_after(e))
+        raise RateLimitExceeded("LLM provider rate limit reached", retry_after=_retry_after(e)) from e
+    except Exception:
+        LLM_ERRORS.labels(operation).inc()
+        raise
+    finally:
+        LLM_REQUEST_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def _admitted(operation: str, messages: list[BaseMessage], max_tokens: int, queue_timeout: Optional[float]):
+    """Hold an LLM call slot and its rate budget for the duration of the block, timing the call."""
+    async with _reserved(_estimate_tokens(messages, max_tokens), queue_timeout), _timed_call(operation):
+        yield
+
+
+def _params(max_tokens: int, temperature: Optional[float]) -> dict:
+    params = {"max_tokens": max_tokens}
+    if temperature is not None:
+        params["temperature"] = temperature
+    return params
+
+
+async def _cached_response(key: str) -> Optional[str]:
+    """Look a call up in the response cache, counting hits and misses."""
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    cached = await cache_get(key)
+    _llm_cache_stats["hits" if cached is not None else "misses"] += 1
+    return cached
+
+
+async def _invoke(messages: list[BaseMessage], max_tokens: int, temperature: Optional[float] = None,
+                  queue_timeout: Optional[float] = None) -> str:
+    """Call ChatGroq, answering identical calls from the response cache."""
+    key = _cache_key(messages, max_tokens, temperature)
+    cached = await _cached_response(key)
+    if cached is not None:
+        return cached
+
+    async with _admitted("invoke", messages, max_tokens, queue_timeout):
+        response = await llm.ainvoke(messages, **_params(max_tokens, temperature))
+    # Failed calls raise before reaching this point, so error strings are never cached
+    await _store_response(key, response.content)
+    return response.content
+
+
+async def _completion_pieces(key: str, messages: list[BaseMessage], max_tokens: int,
+                             temperature: Optional[float]) -> AsyncIterator[str]:
+    """Stream an admitted ChatGroq completion piece by piece, caching it once complete."""
+    pieces = []
+    async with _timed_call("stream"):
+        async for chunk in llm.astream(messages, **_params(max_tokens, temperature)):
+            if chunk.content:
+                pieces.append(chunk.content)
+                yield chunk.content
+    await _store_response(key, "".join(pieces))
+
+
+async def _started(pieces: AsyncIterator[Optional[str]]) -> AsyncIterator[str]:
+    """Run a stream's generator up to its first item, a None yielded once it has been admitted.
+
+    CapacityExhausted is thereby raised to the caller before a response has been started, while
+    whatever the stream holds (e.g. a call slot) stays held until the iterator is exhausted or closed.
+    """
+    await anext(pieces)
+    return pieces
+
+
+async def _stream(messages: list[BaseMessage], max_tokens: int,
+                  temperature: Optional[float] = None) -> AsyncIterator[str]:
+    """Admit a streamed ChatGroq completion, sharing the response cache with _invoke()."""
+    async def pieces():
+        key = _cache_key(messages, max_tokens, temperature)
+        cached = await _cached_response(key)
+        if cached is not None:
+            yield None
+            yield cached
+            return
+        async with _reserved(_estimate_tokens(messages, max_tokens), None):
+            yield None
+            async with aclosing(_completion_pieces(key, messages, max_tokens, temperature)) as completion:
+                async for piece in completion:
+                    yield piece
+
+    return await _started(pieces())
+
+
+async def _stream_prepared(prepare: Callable[[], Awaitable[Optional[list[BaseMessage]]]], prompt_tokens: int,
+                           max_tokens: int, temperature: Optional[float] = None) -> AsyncIterator[str]:
+    """Admit a streamed completion whose messages are only built by prepare() once it is read.
+
+    Rate budget for a prompt of up to `prompt_tokens` tokens is taken up front, and what the actual
+    prompt does not need (all of it if prepare() returns None or the answer is cached) is given back.
+    The call slot is only taken once prepare() has returned: it may make LLM calls of its own, which
+    would otherwise wait for the slots their own stream holds.
+    """
+    reserved = prompt_tokens + max_tokens
+
+    async def pieces():
+        async with _counting_rejections():
+            await governor.reserve_budget(reserved, _queue_timeout(None))
+        yield None
+        messages = await prepare()
+        if messages is None:
+            await governor.refund(reserved, requests=1)
+            return
+        key = _cache_key(messages, max_tokens, temperature)
+        cached = await _cached_response(key)
+        if cached is not None:
+            await governor.refund(reserved, requests=1)
+            yield cached
+            return
+        await governor.refund(reserved, used=_estimate_tokens(messages, max_tokens))
+        async with _counting_rejections(), governor.call_slot(_queue_timeout(None)):
+            async with aclosing(_completion_pieces(key, messages, max_tokens, temperature)) as completion:
+                async for piece in completion:
+                    yield piece
+
+    return await _started(pieces())
+
+
+async def _store_response(key: str, content: str):
+    """Cache a successful, non-empty completion."""
+    if settings.LLM_CACHE_ENABLED and content:
+        await cache_set_bounded(key, content, LLM_CACHE_INDEX,
+                                settings.LLM_CACHE_MAX_ENTRIES, ttl=settings.LLM_CACHE_TTL)
+
+
+def llm_cache_stats() -> dict:
+    """Hit and miss counts of the LLM response cache in this worker."""
+    lookups = _llm_cache_stats["hits"] + _llm_cache_stats["misses"]
+    return {
+        **_llm_cache_stats,
+        "hit_rate": _llm_cache_stats["hits"] / lookups if lookups else None,
+    }
+
+
 async def generate_text(prompt: str, max_tokens: int = 256, temperature: float = 0.7) -> str:
-    """Generate text using ChatGroq"""
+    """Generate text using ChatGroq (raises CapacityExhausted when no call can be made in time)"""
     try:
         logger.info(f"Sending prompt to ChatGroq for text generation with content - {prompt}")
-        response = await llm.ainvoke(
-            [HumanMessage(content=prompt)],
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
+        content = await _invoke([HumanMessage(content=prompt)], max_tokens, temperature)
         logger.info("Text generation successful")
-        return response.content
+        return content
+    except CapacityExhausted:
+        raise
     except Exception as e:
-        return f"[CHATGROQ ERROR] {e}"
+        return f"{CHATGROQ_ERROR} {e}"
+
 
+async def stream_text(prompt: str, max_tokens: int = 256, temperature: float = 0.7) -> AsyncIterator[str]:
+    """Stream generated text from ChatGroq as tokens arrive (errors are raised, not returned).
 
-async def summarize_text(text: str, max_tokens: int = 200) -> str:
-    """Summarize text using ChatGroq"""
+    Raises CapacityExhausted before returning the stream when no call can be made in time.
+    """
+    return await _stream([HumanMessage(content=prompt)], max_tokens, temperature)
+
+
+async def stream_prepared_text(prepare: Callable[[], Awaitable[Optional[str]]], prompt_tokens: int,
+                               max_tokens: int = 256, temperature: float = 0.7) -> AsyncIterator[str]:
+    """Like stream_text, for a prompt of at most `prompt_tokens` tokens that prepare() works out
+    only once the stream is read (nothing is streamed if it returns None)."""
+    async def messages():
+        prompt = await prepare()
+        return [HumanMessage(content=prompt)] if prompt is not None else None
+
+    return await _stream_prepared(messages, prompt_tokens, max_tokens, temperature)
+
+
+def _summary_messages(text: str) -> list[BaseMessage]:
     prompt = (
         "You are a helpful assistant. Summarize the following book content into a concise paragraph (3-5 "
         "sentences):\n\n"
         f"{text}\n\nSummary:"
     )
+    return [
+        SystemMessage(content="You are a helpful assistant that provides concise summaries."),
+        HumanMessage(content=prompt)
+    ]
+
+
+async def summarize_text(text: str, max_tokens: int = 200, queue_timeout: Optional[float] = None) -> str:
+    """Summarize text using ChatGroq (raises CapacityExhausted when no call can be made in time)"""
     try:
-        response = await llm.ainvoke(
-            [
-                SystemMessage(content="You are a helpful assistant that provides concise summaries."),
-                HumanMessage(content=prompt)
-            ],
-            max_tokens=max_tokens
-        )
-        return response.content
+        return await _invoke(_summary_messages(text), max_tokens, queue_timeout=queue_timeout)
+    except CapacityExhausted:
+        raise
     except Exception as e:
-        return f"[SUMMARIZATION ERROR] {e}"
+        return f"{SUMMARIZATION_ERROR} {e}"
+
+
+async def stream_summary(text: str, max_tokens: int = 200) -> AsyncIterator[str]:
+    """Stream a summary of text from ChatGroq as tokens arrive (errors are raised, not returned).
+
+    Raises CapacityExhausted before returning the stream when no call can be made in time.
+    """
+    return await _stream(_summary_messages(text), max_tokens)
+
+
+async def summarize_many(texts: list[str], concurrency: int) -> AsyncIterator[tuple[str, str]]:
+    """Summarize several texts with at most `concurrency` LLM calls in flight.
+
+    Yields (text, summary) pairs in completion order, so one slow text does not hold back the rest.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize_one(text: str) -> tuple[str, str]:
+        async with semaphore:
+            try:
+                return text, await summarize_text(text)
+            except CapacityExhausted as e:
+                # One line of the batch fails; the rest of the stream goes on
+                return text, f"{SUMMARIZATION_ERROR} {e}"
+
+    tasks = [asyncio.create_task(summarize_one(text)) for text in texts]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer went away (e.g. client disconnected): stop the remaining calls
+        for task in tasks:
+            task.cancel()
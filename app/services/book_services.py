@@ -1,69 +1,365 @@
+import orjson
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import func, insert, literal_column
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional, List
+from itertools import islice
+from typing import Iterator, Optional, List, Tuple, Union
+import asyncio
+import base64
+import binascii
+import hashlib
 import logging
 
+from app.config import settings
+from app.db.session import primary_session
 from app.models.models import Book
-from app.schemas.schemas import BookCreate
-from app.utility.redis_client import cache_get, cache_set, cache_delete
+from app.schemas.schemas import BookCreate, BookOut
+from app.services.search_index import search_index
+from app.services.similarity_index import similarity_index
+from app.utility.redis_client import (
+    cache_get,
+    cache_get_many,
+    cache_set,
+    cache_set_many,
+    cache_delete,
+    cache_delete_many,
+    cache_version,
+    cache_bump_version,
+    get_or_compute
+)
+from app.utility.etag import make_etag
 
 logger = logging.getLogger(__name__)
 
+BOOKS_CACHE_NAMESPACE = "books"
+# Cached in place of a book that does not exist, so repeated 404s skip the database
+BOOK_MISSING = {"__missing__": True}
+BOOK_LIST = TypeAdapter(list[BookOut])
+
+
+def encode_cursor(book_id: int) -> str:
+    """Encode the last seen book ID into an opaque pagination cursor."""
+    return base64.urlsafe_b64encode(str(book_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a pagination cursor back into a book ID (raises ValueError if malformed)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def serialize_books(books: List[dict]) -> str:
+    """JSON body of a list of books in the public BookOut shape.
+
+    Pages are validated and encoded once, when they are cached; cache hits are sent as they are.
+    """
+    return orjson.dumps(BOOK_LIST.dump_python(BOOK_LIST.validate_python(books), mode="json")).decode()
+
+
+def book_cache_key(book_id: int) -> str:
+    """Cache key of a single book."""
+    return f"book:{book_id}"
+
+
+def index_book(book: Book):
+    """Refresh a book in the in-process similarity and search indexes."""
+    similarity_index.upsert(book.id, book.title, book.author, book.genre, book.summary)
+    search_index.upsert(book.id, book.title, book.author, book.summary)
+
+
+async def invalidate_book_list():
+    """Invalidate every cached page of the book list."""
+    await cache_bump_version(BOOKS_CACHE_NAMESPACE)
+
+
+def _cached_book(book: Book) -> dict:
+    """Per-book cache entry of a book: its fields plus its version."""
+    return {**book.to_dict(), "version": book.version}
+
+
+async def cache_book(book: Book, notify: bool = True) -> dict:
+    """Store the current state of a book, with its version, in the per-book cache.
+
+    Writes tell the other workers; read-through fills (notify=False) do not.
+    """
+    value = _cached_book(book)
+    await cache_set(book_cache_key(book.id), value, ttl=settings.BOOK_CACHE_TTL, notify=notify)
+    return value
+
+
+def book_etag(book: dict) -> Optional[str]:
+    """ETag of a book (as returned by get_book_by_id), from its version."""
+    return make_etag("book", book["id"], book.get("version"))
+
+
+def reviews_etag(book: dict) -> Optional[str]:
+    """ETag of every page of a book's reviews; reviews only change through add_review, which bumps the version."""
+    return make_etag("reviews", book["id"], book.get("version"))
+
+
+async def evict_book(book_id: int):
+    """Drop a book from the per-book cache so the next read reloads it."""
+    await cache_delete(book_cache_key(book_id))
+
+
+async def cache_book_missing(book_id: int, notify: bool = False):
+    """Remember that a book does not exist (negative cache entry); deletes pass notify=True."""
+    await cache_set(book_cache_key(book_id), BOOK_MISSING, ttl=settings.BOOK_NEGATIVE_CACHE_TTL, notify=notify)
+
 
 async def create_book(db: AsyncSession, data: BookCreate) -> Book:
-    """Create a book with basic information (legacy function)."""
+    """Create a book; books without a summary are marked pending until one is generated."""
     book = Book(**data.model_dump())
+    book.summary_status = "ready" if book.summary else "pending"
     db.add(book)
     await db.commit()
     await db.refresh(book)
-    await cache_delete("books:all")
+    await cache_book(book)
+    await invalidate_book_list()
+    index_book(book)
     return book
 
 
-async def get_all_books(db: AsyncSession):
+async def set_book_summary(db: AsyncSession, book: Book, summary: str) -> Book:
+    """Store a generated summary on an existing book."""
+    book.summary = summary
+    book.summary_status = "ready"
+    book.version = Book.version + 1
+    db.add(book)
+    await db.commit()
+    await db.refresh(book)
+    await cache_book(book)
+    await invalidate_book_list()
+    index_book(book)
+    return book
 
-    """Retrieve all books from the database."""
-    cache_key = "books:all"
-    cached = await cache_get(cache_key)
-    if cached:
-        return cached
 
-    result = await db.execute(select(Book))
-    books = result.scalars().all()
-    await cache_set(cache_key, [book.to_dict() for book in books])
-    return books
+async def set_summary_status(db: AsyncSession, book: Book, status: str) -> Book:
+    """Record the state of a book's background summary."""
+    book.summary_status = status
+    book.version = Book.version + 1
+    db.add(book)
+    await db.commit()
+    await db.refresh(book)
+    await cache_book(book)
+    await invalidate_book_list()
+    return book
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, detail['loc'])) or 'row'}: {detail['msg']}" for detail in error.errors())
+
+
+async def import_books(db: AsyncSession, records: Iterator[Tuple[int, Union[dict, str]]],
+                       batch_size: int = 1000) -> Tuple[dict, List[int]]:
+    """Bulk-insert parsed (row number, record) pairs, one multi-row INSERT and commit per batch.
+
+    Returns a report with per-row errors and the IDs of imported books that still need a summary.
+    Caches are invalidated once for the whole import; summaries are left to the caller to queue.
+    """
+    report = {"imported": 0, "failed": 0, "pending_summaries": 0, "errors": []}
+    pending_ids = []
+
+    def reject(row_number: int, message: str):
+        report["failed"] += 1
+        if len(report["errors"]) < settings.IMPORT_MAX_ERRORS:
+            report["errors"].append({"row": row_number, "error": message})
+
+    while True:
+        # Reading and parsing the upload is blocking file I/O
+        batch = await asyncio.to_thread(lambda: list(islice(records, batch_size)))
+        if not batch:
+            break
+        rows, row_numbers = [], []
+        for row_number, record in batch:
+            if isinstance(record, str):
+                reject(row_number, record)
+                continue
+            try:
+                data = BookCreate.model_validate(record).model_dump()
+            except ValidationError as e:
+                reject(row_number, _validation_message(e))
+                continue
+            data["summary_status"] = "ready" if data["summary"] else "pending"
+            rows.append(data)
+            row_numbers.append(row_number)
+        if not rows:
+            continue
+
+        try:
+            result = await db.execute(insert(Book).returning(Book.id, sort_by_parameter_order=True), rows)
+            book_ids = result.scalars().all()
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Bulk import batch starting at row {row_numbers[0]} failed: {e}")
+            for row_number in row_numbers:
+                reject(row_number, "Database error while inserting this batch")
+            continue
+
+        report["imported"] += len(book_ids)
+        for book_id, data in zip(book_ids, rows):
+            index_book(Book(id=book_id, **data))
+            if data["summary_status"] == "pending":
+                pending_ids.append(book_id)
+        # New IDs may have been looked up (and cached as missing) before they existed
+        await cache_delete_many([book_cache_key(book_id) for book_id in book_ids])
+
+    if report["imported"]:
+        await invalidate_book_list()
+    report["pending_summaries"] = len(pending_ids)
+    return report, pending_ids
+
+
+async def get_all_books(db: AsyncSession, after: Optional[str] = None,
+                        limit: int = 50) -> Tuple[str, Optional[str]]:
+    """Retrieve one page of books ordered by ID as a JSON body, plus the cursor of the next page."""
+    after_id = decode_cursor(after) if after else 0
+    version = await cache_version(BOOKS_CACHE_NAMESPACE)
+    cache_key = f"{BOOKS_CACHE_NAMESPACE}:v{version}:page-body:{after_id}:{limit}"
+
+    async def load_page():
+        # Fetch one extra row to find out whether another page follows
+        q = select(Book).where(Book.id > after_id).order_by(Book.id).limit(limit + 1)
+        async with primary_session(db) as session:
+            result = await session.execute(q)
+            books = result.scalars().all()
+        items = [book.to_dict() for book in books[:limit]]
+        next_cursor = encode_cursor(items[-1]["id"]) if len(books) > limit else None
+        return {"body": serialize_books(items), "next_cursor": next_cursor}
+
+    page = await get_or_compute(cache_key, load_page)
+    return page["body"], page["next_cursor"]
+
+
+async def _search_book_ids(db: AsyncSession, q: str, offset: int, limit: int) -> List[int]:
+    if db.bind.dialect.name == "postgresql":
+        query = func.websearch_to_tsquery("english", q)
+        vector = literal_column("books.search_vector")
+        result = await db.execute(
+            select(Book.id)
+            .where(vector.op("@@")(query))
+            .order_by(func.ts_rank_cd(vector, query).desc(), Book.id)
+            .offset(offset)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+    await search_index.ensure_built(db)
+    return search_index.search(q, offset, limit)
 
 
-async def get_book_by_id(db: AsyncSession, book_id: int):
-    """Retrieve a book by ID."""
+async def search_books(db: AsyncSession, q: str, after: Optional[str] = None,
+                       limit: int = 20) -> Tuple[str, Optional[str]]:
+    """Full-text search over title, author and summary, best match first, as a JSON body plus the next cursor."""
+    offset = decode_cursor(after) if after else 0
+    version = await cache_version(BOOKS_CACHE_NAMESPACE)
+    digest = hashlib.sha256(q.strip().lower().encode()).hexdigest()[:16]
+    cache_key = f"{BOOKS_CACHE_NAMESPACE}:v{version}:search-body:{digest}:{offset}:{limit}"
+
+    async def load_page():
+        # Fetch one extra match to find out whether another page follows
+        async with primary_session(db) as session:
+            book_ids = await _search_book_ids(session, q, offset, limit + 1)
+            result = await session.execute(select(Book).where(Book.id.in_(book_ids[:limit])))
+            books = {book.id: book for book in result.scalars().all()}
+        items = [books[book_id].to_dict() for book_id in book_ids[:limit] if book_id in books]
+        next_cursor = encode_cursor(offset + limit) if len(book_ids) > limit else None
+        return {"body": serialize_books(items), "next_cursor": next_cursor}
+
+    page = await get_or_compute(cache_key, load_page)
+    return page["body"], page["next_cursor"]
+
+
+async def fetch_book(db: AsyncSession, book_id: int) -> Optional[Book]:
+    """Load a book row by ID, bypassing the cache (used by write paths)."""
     result = await db.execute(select(Book).where(Book.id == book_id))
     return result.scalar_one_or_none()
 
 
+async def fetch_book_version(db: AsyncSession, book_id: int) -> Optional[int]:
+    """Read a book's version in the caller's session, bypassing the cache (None if the book is not there)."""
+    result = await db.execute(select(Book.version).where(Book.id == book_id))
+    return result.scalar_one_or_none()
+
+
+async def get_book_by_id(db: AsyncSession, book_id: int) -> Optional[dict]:
+    """Retrieve a book by ID through the per-book read-through cache."""
+    cache_key = book_cache_key(book_id)
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return None if cached == BOOK_MISSING else cached
+
+    book = await fetch_book(db, book_id)
+    if not book:
+        await cache_book_missing(book_id)
+        return None
+    return await cache_book(book, notify=False)
+
+
+async def get_books_by_ids(db: AsyncSession, book_ids: List[int]) -> List[dict]:
+    """Retrieve several books, in the given order, through the per-book cache.
+
+    One cache round trip for all of them and one query for the misses, instead of a lookup per
+    book. Books that do not exist are left out.
+    """
+    cached = await cache_get_many([book_cache_key(book_id) for book_id in book_ids])
+    found = {book_id: value for book_id, value in zip(book_ids, cached) if value is not None}
+    misses = [book_id for book_id in book_ids if book_id not in found]
+    if misses:
+        result = await db.execute(select(Book).where(Book.id.in_(misses)))
+        loaded = {book.id: _cached_book(book) for book in result.scalars().all()}
+        await cache_set_many({book_cache_key(book_id): value for book_id, value in loaded.items()},
+                             ttl=settings.BOOK_CACHE_TTL, notify=False)
+        await cache_set_many({book_cache_key(book_id): BOOK_MISSING for book_id in misses if book_id not in loaded},
+                             ttl=settings.BOOK_NEGATIVE_CACHE_TTL, notify=False)
+        found.update(loaded)
+    return [found[book_id] for book_id in book_ids if found.get(book_id, BOOK_MISSING) != BOOK_MISSING]
+
+
 async def update_book(db: AsyncSession, book_id: int, data: BookCreate) -> Optional[Book]:
     """Update a book by ID."""
-    book = await get_book_by_id(db, book_id)
+    book = await fetch_book(db, book_id)
     if not book:
+        await cache_book_missing(book_id)
         return None
 
     for key, value in data.model_dump(exclude_unset=True).items():
         setattr(book, key, value)
+    book.version = Book.version + 1
 
     db.add(book)
     await db.commit()
     await db.refresh(book)
-    await cache_delete("books:all")
+    await cache_book(book)
+    await invalidate_book_list()
+    index_book(book)
     return book
 
 
 async def delete_book(db: AsyncSession, book_id: int) -> Optional[Book]:
     """Delete a book by ID."""
-    book = await get_book_by_id(db, book_id)
+    book = await fetch_book(db, book_id)
     if not book:
+        await cache_book_missing(book_id)
         return None
 
     await db.delete(book)
     await db.commit()
-    await cache_delete("books:all")
+    await cache_book_missing(book_id, notify=True)
+    await invalidate_book_list()
+    similarity_index.remove(book_id)
+    search_index.remove(book_id)
     return book
 
+
+async def get_similar_books(db: AsyncSession, book_id: int, limit: int = 10) -> List[dict]:
+    """Books most similar in content to the given one, each with its cosine `similarity`."""
+    await similarity_index.ensure_built(db)
+    scores = dict(similarity_index.similar(book_id, limit))
+    # Books deleted in another worker since its last rebuild are skipped
+    books = await get_books_by_ids(db, list(scores))
+    return [{**book, "similarity": round(scores[book["id"]], 4)} for book in books]
@@ -0,0 +1,61 @@
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.models import Book, Review
+
+BOOK_EXPORT_COLUMNS = (Book.id, Book.title, Book.author, Book.genre, Book.year_published, Book.summary,
+                       Book.summary_status, Book.updated_at)
+REVIEW_EXPORT_COLUMNS = (Review.id, Review.book_id, Review.user_id, Review.review_text, Review.rating,
+                         Review.created_at)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+async def _stream_ndjson(db: AsyncSession, statement) -> AsyncIterator[bytes]:
+    """Run a query through a server-side cursor and yield one NDJSON chunk per batch of rows.
+
+    Plain column rows are selected instead of ORM objects so nothing accumulates in the
+    session's identity map; memory use stays at one batch whatever the table size.
+    """
+    result = await db.stream(statement.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+    async for rows in result.mappings().partitions():
+        yield "".join(json.dumps(dict(row), default=_json_default) + "\n" for row in rows).encode()
+
+
+async def stream_books(db: AsyncSession, updated_since: Optional[datetime] = None) -> AsyncIterator[bytes]:
+    """Every book (or those written since `updated_since`) as NDJSON, in ID order."""
+    statement = select(*BOOK_EXPORT_COLUMNS).order_by(Book.id)
+    if updated_since is not None:
+        statement = statement.where(Book.updated_at >= updated_since)
+    async for chunk in _stream_ndjson(db, statement):
+        yield chunk
+
+
+async def stream_reviews(db: AsyncSession, updated_since: Optional[datetime] = None) -> AsyncIterator[bytes]:
+    """Every review (or those posted since `updated_since`) as NDJSON, in ID order."""
+    statement = select(*REVIEW_EXPORT_COLUMNS).order_by(Review.id)
+    if updated_since is not None:
+        # Reviews cannot be edited, so their creation time is their last write
+        statement = statement.where(Review.created_at >= updated_since)
+    async for chunk in _stream_ndjson(db, statement):
+        yield chunk
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip-compress a byte stream on the fly."""
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.base import SessionLocal
+from app.models.models import Book, Review
+from app.services import book_services
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Prior weight of the global mean in the popularity ranking (Bayesian average)
+POPULARITY_PRIOR_WEIGHT = 5.0
+
+
+@dataclass
+class _Model:
+    """Immutable snapshot of everything needed to answer a recommendation query."""
+    book_ids: np.ndarray                # item index -> book ID
+    book_index: dict                    # book ID -> item index
+    genres: np.ndarray                  # item index -> genre
+    authors: np.ndarray                 # item index -> author
+    user_ratings: dict                  # user ID -> (item indices, ratings)
+    neighbors: list                     # item index -> (neighbor indices, similarities), top-K only
+    popular: np.ndarray                 # item indices, most popular first
+    global_mean: float
+    built_at: float = field(default_factory=time.time)
+
+
+def build_model(books: list, reviews: list, top_k: int) -> _Model:
+    """Build the item-item similarity model from (id, genre, author) and (user_id, book_id, rating) rows."""
+    book_ids = np.array([row[0] for row in books], dtype=np.int64)
+    book_index = {int(book_id): index for index, book_id in enumerate(book_ids)}
+    genres = np.array([row[1] for row in books], dtype=object)
+    authors = np.array([row[2] for row in books], dtype=object)
+
+    reviews = [row for row in reviews if row[1] in book_index]
+    user_list = sorted({row[0] for row in reviews})
+    user_index = {user_id: index for index, user_id in enumerate(user_list)}
+    rows = np.array([user_index[row[0]] for row in reviews], dtype=np.int64)
+    cols = np.array([book_index[row[1]] for row in reviews], dtype=np.int64)
+    ratings = np.array([row[2] for row in reviews], dtype=np.float64)
+    global_mean = float(ratings.mean()) if len(ratings) else 3.0
+
+    # User x book matrix of mean-centred ratings (duplicate reviews are summed)
+    matrix = sparse.csr_matrix((ratings - global_mean, (rows, cols)), shape=(len(user_list), len(book_ids)))
+
+    # Cosine similarity between book columns, keeping only the top-K neighbours of each book
+    items = matrix.T.tocsr()
+    norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    items = sparse.diags(1.0 / norms) @ items
+    similarity = (items @ items.T).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    neighbors = []
+    for item in range(len(book_ids)):
+        start, end = similarity.indptr[item], similarity.indptr[item + 1]
+        indices, values = similarity.indices[start:end], similarity.data[start:end]
+        if len(values) > top_k:
+            keep = np.argpartition(-values, top_k)[:top_k]
+            indices, values = indices[keep], values[keep]
+        neighbors.append((indices, values))
+
+    user_ratings = {}
+    by_user = matrix.tocsr()
+    for user_id, index in user_index.items():
+        start, end = by_user.indptr[index], by_user.indptr[index + 1]
+        user_ratings[user_id] = (by_user.indices[start:end], by_user.data[start:end] + global_mean)
+
+    counts = np.bincount(cols, minlength=len(book_ids)).astype(np.float64)
+    sums = np.bincount(cols, weights=ratings, minlength=len(book_ids))
+    bayesian = (sums + POPULARITY_PRIOR_WEIGHT * global_mean) / (counts + POPULARITY_PRIOR_WEIGHT)
+    popular = np.lexsort((-counts, -bayesian))
+
+    return _Model(book_ids, book_index, genres, authors, user_ratings, neighbors, popular, global_mean)
+
+
+class RecommendationEngine:
+    """Item-item collaborative filtering over the reviews table, served from memory.
+
+    The model is rebuilt periodically; ratings added in between are folded into the
+    rating user's profile right away, so their next recommendations already account for them.
+    """
+
+    def __init__(self, top_k: int = 50):
+        self.top_k = top_k
+        self.model: Optional[_Model] = None
+        self._recent: dict = {}
+        # Ratings taken from _recent by the build in progress, folded in until its model is swapped in
+        self._in_build: dict = {}
+        self._lock = asyncio.Lock()
+
+    async def _build(self, db: AsyncSession):
+        # Ratings recorded so far are committed, so the queries below include them; ratings recorded
+        # from here on go to a fresh dict that outlives the new model
+        self._in_build, self._recent = self._recent, {}
+        try:
+            books = (await db.execute(select(Book.id, Book.genre, Book.author).order_by(Book.id))).all()
+            reviews = (await db.execute(select(Review.user_id, Review.book_id, Review.rating))).all()
+            started = time.perf_counter()
+            # Matrix work is CPU bound; keep it off the event loop
+            self.model = await asyncio.to_thread(build_model, books, reviews, self.top_k)
+        except BaseException:
+            # No new model: keep folding those ratings in until a build succeeds
+            for user_id, ratings in self._in_build.items():
+                self._recent[user_id] = {**ratings, **self._recent.get(user_id, {})}
+            raise
+        finally:
+            self._in_build = {}
+        logger.info(f"Recommendation model rebuilt with {len(books)} books and {len(reviews)} ratings "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+    async def rebuild(self, db: AsyncSession):
+        """Reload ratings and recompute similarities, then swap the new model in."""
+        async with self._lock:
+            await self._build(db)
+
+    async def ensure_built(self, db: AsyncSession):
+        """Build the model on first use."""
+        if self.model is None:
+            async with self._lock:
+                if self.model is None:
+                    await self._build(db)
+
+    def add_rating(self, user_id: int, book_id: int, rating: float):
+        """Fold a new rating into the user's profile until the next rebuild."""
+        self._recent.setdefault(user_id, {})[book_id] = rating
+
+    def _user_profile(self, model: _Model, user_id: Optional[int]):
+        indices, ratings = model.user_ratings.get(user_id, (np.empty(0, dtype=np.int64), np.empty(0)))
+        pending = {**self._in_build.get(user_id, {}), **self._recent.get(user_id, {})}
+        recent = [(model.book_index[book_id], rating)
+                  for book_id, rating in pending.items() if book_id in model.book_index]
+        if recent:
+            indices = np.concatenate([indices, np.array([index for index, _ in recent], dtype=np.int64)])
+            ratings = np.concatenate([ratings, np.array([rating for _, rating in recent])])
+        return indices, ratings
+
+    def recommend(self, user_id: Optional[int] = None, genre: Optional[str] = None,
+                  author: Optional[str] = None, limit: int = 10) -> list[int]:
+        """Rank book IDs for a user (most popular books for anonymous or cold-start users)."""
+        model = self.model
+        if model is None or not len(model.book_ids):
+            return []
+
+        rated, ratings = self._user_profile(model, user_id)
+        ranked = np.empty(0, dtype=np.int64)
+        if len(rated):
+            neighbor_lists = [model.neighbors[item] for item in rated]
+            weights = ratings - model.global_mean
+            targets = np.concatenate([indices for indices, _ in neighbor_lists])
+            sims = np.concatenate([values for _, values in neighbor_lists])
+            contributions = np.concatenate([values * weight for (_, values), weight in zip(neighbor_lists, weights)])
+            size = len(model.book_ids)
+            scores = np.bincount(targets, weights=contributions, minlength=size)
+            norm = np.bincount(targets, weights=np.abs(sims), minlength=size)
+            candidates = np.flatnonzero(norm)
+            scores = scores[candidates] / norm[candidates]
+            by_score = np.argsort(-scores, kind="stable")
+            # Only books predicted to be rated above the global mean count as personalized picks
+            ranked = candidates[by_score][scores[by_score] > 0]
+
+        # Personalized picks first, then popular books to fill up the list
+        order = np.concatenate([ranked, model.popular])
+        seen = set(rated.tolist())
+        results = []
+        for item in order:
+            item = int(item)
+            if item in seen:
+                continue
+            seen.add(item)
+            if genre and model.genres[item] != genre:
+                continue
+            if author and model.authors[item] != author:
+                continue
+            results.append(int(model.book_ids[item]))
+            if len(results) >= limit:
+                break
+        return results
+
+
+recommender = RecommendationEngine(settings.RECOMMENDER_TOP_K)
+
+
+async def get_recommendations(db: AsyncSession, user_id: Optional[int] = None, genre: Optional[str] = None,
+                              author: Optional[str] = None, limit: int = 10) -> list[dict]:
+    """Ranked, personalized book recommendations with optional genre/author filters."""
+    await recommender.ensure_built(db)
+    book_ids = recommender.recommend(user_id, genre, author, limit)
+    # Books deleted since the last rebuild are skipped
+    return await book_services.get_books_by_ids(db, book_ids)
+
+
+async def run_recommender_refresh():
+    """Rebuild the recommendation model every RECOMMENDER_REBUILD_INTERVAL seconds."""
+    while True:
+        try:
+            async with SessionLocal() as db:
+                await recommender.rebuild(db)
+        except Exception as e:
+            logger.error(f"Recommendation model rebuild failed: {e}")
+        await asyncio.sleep(settings.RECOMMENDER_REBUILD_INTERVAL)
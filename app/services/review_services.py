@@ -1,17 +1,60 @@
-from typing import Optional
+import asyncio
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
 from fastapi import HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, delete, insert, update, case, tuple_
+from sqlalchemy.sql import Select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from app.models.models import Book, Review
+from app.config import settings
+from app.models.models import Book, Review, BookRatingStats
 from app.schemas.schemas import ReviewCreate
 from app.services import book_services
-from app.services.ai_service import generate_text
+from app.services.recommendation_services import recommender
+from app.services.ai_service import generate_text, stream_prepared_text, CHATGROQ_ERROR
+
+REVIEW_MAP_PROMPT = ("Summarize these reviews into a concise summary and mention common pros and cons:"
+                     "\n\n{text}\n\nSummary:")
+REVIEW_REDUCE_PROMPT = ("Combine these partial summaries of a book's reviews into one concise summary and mention "
+                        "common pros and cons:\n\n{text}\n\nSummary:")
+
+
+def _rating_bucket(rating: float) -> int:
+    """Star bucket (1-5) a rating is counted in."""
+    return min(5, max(1, int(round(rating))))
+
+
+def _upsert(db: AsyncSession):
+    """Dialect-specific INSERT construct that supports ON CONFLICT."""
+    return sqlite_insert if db.bind.dialect.name == "sqlite" else pg_insert
+
+
+async def _increment_rating_stats(db: AsyncSession, book_id: int, rating: float):
+    """Add one rating to a book's aggregate inside the caller's transaction."""
+    bucket = f"rating_{_rating_bucket(rating)}"
+    stmt = _upsert(db)(BookRatingStats).values(book_id=book_id, review_count=1, rating_sum=rating, **{bucket: 1})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BookRatingStats.book_id],
+        set_={
+            "review_count": BookRatingStats.review_count + 1,
+            "rating_sum": BookRatingStats.rating_sum + rating,
+            bucket: getattr(BookRatingStats, bucket) + 1,
+        }
+    )
+    await db.execute(stmt)
 
 
 async def add_review(book_id: int, review_data: ReviewCreate, current_user, db: AsyncSession):
-    """Add a review for a specific book."""
-    result = await db.execute(select(Book).where(Book.id == book_id))
+    """Add a review for a specific book, bumping the book's version (its reviews' ETag)."""
+    # The version bump doubles as the existence check, so no SELECT is needed first
+    result = await db.execute(
+        update(Book).where(Book.id == book_id).values(version=Book.version + 1).returning(Book)
+    )
     book = result.scalars().first()
     if not book:
         return None  # Book not found
@@ -23,45 +66,223 @@ async def add_review(book_id: int, review_data: ReviewCreate, current_user, db:
         rating=review_data.rating
     )
     db.add(new_review)
+    await _increment_rating_stats(db, book_id, review_data.rating)
     await db.commit()
     await db.refresh(new_review)
+    await book_services.cache_book(book)
+    recommender.add_rating(current_user.id, book_id, new_review.rating)
     return new_review
 
 
-async def get_reviews(book_id: int, db: AsyncSession):
-    """Retrieve all reviews for a specific book."""
-    result = await db.execute(select(Review).where(Review.book_id == book_id))
+# Sort orders of a book's review listing: the keyset columns, all descending
+REVIEW_SORTS = {
+    "recent": (Review.created_at, Review.id),
+    "rating": (Review.rating, Review.created_at, Review.id),
+}
+
+
+def encode_review_cursor(review: Review, sort: str) -> str:
+    """Encode the sort key of the last review on a page into an opaque cursor."""
+    values = [getattr(review, column.key) for column in REVIEW_SORTS[sort]]
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_review_cursor(cursor: str, sort: str) -> list:
+    """Decode a review cursor back into sort key values (raises ValueError if malformed)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        columns = REVIEW_SORTS[sort]
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [datetime.fromisoformat(value) if column.key == "created_at" else value
+                for column, value in zip(columns, values)]
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def reviews_page_query(book_id: int, sort: str = "recent", after: Optional[list] = None, limit: int = 20) -> Select:
+    """Query of one page of a book's reviews, continuing after the given sort key values."""
+    columns = REVIEW_SORTS[sort]
+    q = select(Review).where(Review.book_id == book_id)
+    if after is not None:
+        q = q.where(tuple_(*columns) < tuple_(*after))
+    return q.order_by(*(column.desc() for column in columns)).limit(limit)
+
+
+async def get_reviews(book_id: int, db: AsyncSession, sort: str = "recent", after: Optional[str] = None,
+                      limit: int = 20) -> Tuple[List[Review], Optional[str]]:
+    """Retrieve one page of a book's reviews, newest or best rated first, plus the cursor of the next page."""
+    after_values = decode_review_cursor(after, sort) if after else None
+    # Fetch one extra row to find out whether another page follows
+    result = await db.execute(reviews_page_query(book_id, sort, after_values, limit + 1))
+    reviews = result.scalars().all()
+    next_cursor = encode_review_cursor(reviews[limit - 1], sort) if len(reviews) > limit else None
+    return reviews[:limit], next_cursor
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def chunk_texts(texts: list[str], max_tokens: int) -> list[str]:
+    """Greedily pack texts, in order, into chunks of at most max_tokens (estimated) tokens.
+
+    Packing from the start keeps earlier chunks byte-for-byte identical when texts are appended,
+    so their summaries keep hitting the LLM response cache and only the last chunk is redone.
+    """
+    chunks, current, size = [], [], 0
+    for text in texts:
+        text = text[:max_tokens * 4]
+        tokens = _estimate_tokens(text)
+        if current and size + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(text)
+        size += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+async def _final_review_prompt(texts: list[str]) -> tuple[Optional[str], Optional[str]]:
+    """Reduce any number of reviews to the single prompt that produces their summary.
+
+    Token-budgeted chunks are summarized concurrently and their partial summaries combined
+    until everything fits in one chunk. Returns (prompt, error), with prompt None if there is
+    nothing to summarize.
+    """
+    chunks = chunk_texts([text for text in texts if text.strip()], settings.REVIEW_CHUNK_TOKENS)
+    semaphore = asyncio.Semaphore(settings.REVIEW_SUMMARY_CONCURRENCY)
+
+    async def summarize_chunk(prompt: str, chunk: str) -> str:
+        async with semaphore:
+            return await generate_text(prompt.format(text=chunk), max_tokens=settings.REVIEW_SUMMARY_MAX_TOKENS)
+
+    async def summarize_chunks(prompt: str) -> list[str]:
+        tasks = [asyncio.create_task(summarize_chunk(prompt, chunk)) for chunk in chunks]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            # A chunk ran out of capacity, or the caller went away: stop the remaining calls
+            for task in tasks:
+                task.cancel()
+
+    prompt = REVIEW_MAP_PROMPT
+    while len(chunks) > 1:
+        partials = await summarize_chunks(prompt)
+        failed = [partial for partial in partials if partial.startswith(CHATGROQ_ERROR)]
+        if failed:
+            return None, failed[0]
+        reduced = chunk_texts(partials, settings.REVIEW_CHUNK_TOKENS)
+        if len(reduced) >= len(chunks):
+            # Partials too long to share a chunk would be summarized one by one forever: pair them
+            # up instead, so every round at least halves the input
+            reduced = ["\n\n".join(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+        chunks = reduced
+        prompt = REVIEW_REDUCE_PROMPT
+    if not chunks:
+        return None, None
+    return prompt.format(text=chunks[0]), None
+
+
+async def summarize_reviews(texts: list[str]) -> Optional[str]:
+    """Summarize any number of reviews: summarize token-budgeted chunks concurrently, then combine them."""
+    prompt, error = await _final_review_prompt(texts)
+    if error or prompt is None:
+        return error
+    return await generate_text(prompt, max_tokens=settings.REVIEW_SUMMARY_MAX_TOKENS)
+
+
+async def stream_review_summary(book_id: int, db: AsyncSession) -> AsyncIterator[str]:
+    """Like summarize_reviews for a book's reviews, but streams the final summary as tokens arrive (errors are raised).
+
+    Rate budget for the final call, sized for the largest prompt a chunk can make, is taken before
+    this returns; the reviews are only read and reduced to that prompt once the stream is read.
+    """
+    async def prepare() -> Optional[str]:
+        prompt, error = await _final_review_prompt(await get_review_texts(book_id, db))
+        if error:
+            raise RuntimeError(error.removeprefix(CHATGROQ_ERROR).strip())
+        return prompt
+
+    longest_prompt = max(_estimate_tokens(REVIEW_MAP_PROMPT), _estimate_tokens(REVIEW_REDUCE_PROMPT))
+    return await stream_prepared_text(prepare, longest_prompt + settings.REVIEW_CHUNK_TOKENS,
+                                      max_tokens=settings.REVIEW_SUMMARY_MAX_TOKENS)
+
+
+async def get_review_texts(book_id: int, db: AsyncSession) -> list[str]:
+    """Retrieve the text of every review of a book, oldest first."""
+    result = await db.execute(select(Review.review_text).where(Review.book_id == book_id).order_by(Review.id))
     return result.scalars().all()
 
 
+async def get_rating_stats(db: AsyncSession, book_id: int) -> Optional[BookRatingStats]:
+    """Retrieve the rating aggregate of a specific book (None if it has no reviews)."""
+    return await db.get(BookRatingStats, book_id)
+
+
 async def aggregated_rating(db: AsyncSession, book_id: int) -> Optional[float]:
-    """Calculate the average rating for a specific book."""
-    q = select(func.avg(Review.rating)).where(Review.book_id == book_id)
-    resp = await db.execute(q)
-    avg_rating = resp.scalar_one_or_none()
-    return float(avg_rating) if avg_rating is not None else None
+    """Average rating of a specific book, read from its rating aggregate."""
+    stats = await get_rating_stats(db, book_id)
+    return stats.average() if stats else None
 
 
-async def get_book_summary(book_id: int, db: AsyncSession):
-    """Get AI-generated summary of reviews and aggregated rating for a specific book."""
-    # Fetch book
+async def reconcile_rating_stats(db: AsyncSession, book_id: Optional[int] = None) -> int:
+    """Rebuild rating aggregates from the reviews table (all books, or a single one).
+
+    Returns the number of aggregates written.
+    """
+    q = select(
+        Review.book_id,
+        func.count(Review.id),
+        func.sum(Review.rating),
+        *(func.sum(case((func.round(Review.rating) == star, 1), else_=0)) for star in range(1, 6))
+    ).group_by(Review.book_id)
+    clear = delete(BookRatingStats)
+    if book_id is not None:
+        q = q.where(Review.book_id == book_id)
+        clear = clear.where(BookRatingStats.book_id == book_id)
+
+    rows = (await db.execute(q)).all()
+    await db.execute(clear)
+    if rows:
+        # Ratings are validated to 1-5, so round() puts every review in exactly one bucket
+        await db.execute(insert(BookRatingStats), [
+            {
+                "book_id": row_book_id,
+                "review_count": count,
+                "rating_sum": float(total),
+                **{f"rating_{star}": histogram[star - 1] for star in range(1, 6)},
+            }
+            for row_book_id, count, total, *histogram in rows
+        ])
+    await db.commit()
+    return len(rows)
+
+
+async def get_book_overview(book_id: int, db: AsyncSession) -> dict:
+    """Get a book's details together with its aggregated rating (no LLM involved)."""
     book = await book_services.get_book_by_id(db, book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    # aggregated rating
-    avg = await aggregated_rating(db, book_id)
-    # generate review summary using llama from reviews text
-    reviews = await get_reviews(book_id, db)
-    review_texts = "\n\n".join(r.review_text for r in reviews)
-    review_summary = None
-    if review_texts.strip():
-        prompt = f"Summarize these reviews into a concise summary and mention common pros and cons:\n\n{review_texts}\n\nSummary:"
-        review_summary = await generate_text(prompt, max_tokens=200)
+    stats = await get_rating_stats(db, book_id)
     return {
-        "book_id": book.id,
-        "title": book.title,
-        "summary": book.summary,
-        "average_rating": avg,
-        "review_summary": review_summary,
+        "book_id": book["id"],
+        "title": book["title"],
+        "summary": book["summary"],
+        "average_rating": stats.average() if stats else None,
+        "review_count": stats.review_count if stats else 0,
+        "rating_histogram": stats.histogram() if stats else None,
     }
+
+
+async def get_book_summary(book_id: int, db: AsyncSession):
+    """Get AI-generated summary of reviews and aggregated rating for a specific book."""
+    overview = await get_book_overview(book_id, db)
+    # generate review summary using llama from reviews text
+    overview["review_summary"] = await summarize_reviews(await get_review_texts(book_id, db))
+    return overview
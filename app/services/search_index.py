@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import logging
+import math
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import Book
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has he her his in is it its of on or she that the their "
+    "they this to was were will with".split()
+)
+# Same relative weights as the A/B/C weights of the Postgres search vector
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "summary": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _stem(word: str) -> str:
+    """Very light English stemming, so plural and singular forms match."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """Lowercased, stemmed words of a text without stopwords."""
+    return [_stem(word) for word in _WORD.findall((text or "").lower()) if word not in STOPWORDS]
+
+
+def _document(title: str, author: Optional[str], summary: Optional[str]) -> Counter:
+    terms = Counter()
+    for field, text in (("title", title), ("author", author), ("summary", summary)):
+        for term in tokenize(text):
+            terms[term] += FIELD_WEIGHTS[field]
+    return terms
+
+
+class SearchIndex:
+    """In-process inverted index with BM25 ranking, the full-text search backend on SQLite.
+
+    Postgres deployments search the `books.search_vector` column instead and never build it.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the next search rebuilds the index."""
+        self.postings: dict[str, dict[int, float]] = {}
+        self.terms: dict[int, tuple] = {}
+        self.lengths: dict[int, float] = {}
+        self.total_length = 0.0
+        self.built = False
+        self._building = False
+        self._pending = []
+
+    def _add(self, book_id: int, terms: Counter):
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[book_id] = frequency
+        self.terms[book_id] = tuple(terms)
+        length = sum(terms.values())
+        self.lengths[book_id] = length
+        self.total_length += length
+
+    def _build(self, books: list):
+        self.postings, self.terms, self.lengths, self.total_length = {}, {}, {}, 0.0
+        for book_id, title, author, summary in books:
+            self._add(book_id, _document(title, author, summary))
+
+    async def _rebuild(self, db: AsyncSession):
+        # Writes are queued from before the books are read: the postings they would go to are replaced
+        self._building = True
+        try:
+            result = await db.execute(select(Book.id, Book.title, Book.author, Book.summary))
+            books = result.all()
+            started = time.perf_counter()
+            fresh = SearchIndex()
+            await asyncio.to_thread(fresh._build, books)
+        except BaseException:
+            # The current postings stay in use, so they get the queued writes instead
+            self._building = False
+            self._replay_pending()
+            raise
+        self._building = False
+        self.postings, self.terms = fresh.postings, fresh.terms
+        self.lengths, self.total_length = fresh.lengths, fresh.total_length
+        self.built = True
+        # Writes that landed while the fresh index was being built
+        self._replay_pending()
+        logger.info(f"Search index rebuilt with {len(books)} books in {time.perf_counter() - started:.2f}s")
+
+    def _replay_pending(self):
+        pending, self._pending = self._pending, []
+        for action, args in pending:
+            getattr(self, action)(*args)
+
+    async def rebuild(self, db: AsyncSession):
+        """Rebuild the index from the books table."""
+        async with self._lock:
+            await self._rebuild(db)
+
+    async def ensure_built(self, db: AsyncSession):
+        """Build the index on first use."""
+        if not self.built:
+            async with self._lock:
+                if not self.built:
+                    await self._rebuild(db)
+
+    def upsert(self, book_id: int, title: str, author: Optional[str], summary: Optional[str]):
+        """Add or replace a single book's postings."""
+        if self._building:
+            self._pending.append(("upsert", (book_id, title, author, summary)))
+            return
+        if not self.built:
+            return
+        self._discard(book_id)
+        self._add(book_id, _document(title, author, summary))
+
+    def remove(self, book_id: int):
+        """Drop a book's postings."""
+        if self._building:
+            self._pending.append(("remove", (book_id,)))
+            return
+        self._discard(book_id)
+
+    def _discard(self, book_id: int):
+        length = self.lengths.pop(book_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.terms.pop(book_id):
+            del self.postings[term][book_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> list[int]:
+        """IDs of the books containing every query term, best BM25 score first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.lengths:
+            return []
+        postings = [self.postings.get(term) for term in terms]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+
+        documents = len(self.lengths)
+        average_length = self.total_length / documents
+        weights = [math.log(1 + (documents - len(books) + 0.5) / (len(books) + 0.5)) for books in postings]
+
+        def score(book_id):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[book_id] / average_length)
+            return sum(weight * books[book_id] * (BM25_K1 + 1) / (books[book_id] + norm)
+                       for weight, books in zip(weights, postings))
+
+        ranked = heapq.nsmallest(offset + limit, candidates, key=lambda book_id: (-score(book_id), book_id))
+        return ranked[offset:]
+
+
+search_index = SearchIndex()
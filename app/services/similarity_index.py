@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.base import SessionLocal
+from app.models.models import Book
+from app.utility import redis_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def book_features(title: str, author: Optional[str], genre: Optional[str], summary: Optional[str]) -> Counter:
+    """Term counts of a book: words and word pairs of title and summary, plus whole author/genre tokens."""
+    features = Counter()
+    for field, text in (("t", title), ("s", summary)):
+        words = _WORD.findall((text or "").lower())
+        features.update(f"{field}:{word}" for word in words)
+        features.update(f"{field}:{first}_{second}" for first, second in zip(words, words[1:]))
+        # Plain words as well, so a title word also matches the same word in another book's summary
+        features.update(words)
+    if author:
+        features[f"author:{author.strip().lower()}"] += 1
+    if genre:
+        features[f"genre:{genre.strip().lower()}"] += 1
+    return features
+
+
+def hash_features(features: Counter, dimensions: int) -> tuple[np.ndarray, np.ndarray]:
+    """Hash term counts into (indices, log-scaled term frequencies), with a sign bit against collision bias."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for term, count in features.items():
+        digest = zlib.crc32(term.encode())
+        sign = 1.0 if digest & 0x80000000 else -1.0
+        vector[digest % dimensions] += sign * (1.0 + math.log(count))
+    indices = np.flatnonzero(vector)
+    return indices, vector[indices]
+
+
+class SimilarityIndex:
+    """In-process TF-IDF index of the book catalog over hashed n-gram features.
+
+    Rows are idf-weighted, L2-normalized dense vectors, so similarity is one matrix-vector
+    product. Writes update single rows in place; the idf weights are refreshed on full rebuilds.
+    """
+
+    def __init__(self, dimensions: int, path: Optional[str] = None):
+        self.dimensions = dimensions
+        self.path = path
+        self._lock = asyncio.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the next query rebuilds the index."""
+        self.vectors = np.zeros((0, self.dimensions), dtype=np.float32)
+        self.book_ids = np.zeros(0, dtype=np.int64)
+        self.document_frequency = np.zeros(self.dimensions, dtype=np.float64)
+        self.rows = {}
+        self.built = False
+        self._building = False
+        self._pending = []
+        self._changed = set()
+
+    # ----------------- building -----------------
+
+    def _idf(self) -> np.ndarray:
+        documents = max(len(self.rows), 1)
+        return (np.log((1.0 + documents) / (1.0 + self.document_frequency)) + 1.0).astype(np.float32)
+
+    def _weighted(self, indices: np.ndarray, frequencies: np.ndarray, idf: np.ndarray) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        vector[indices] = frequencies * idf[indices]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _build_arrays(self, books: list):
+        hashed = [hash_features(book_features(*book[1:]), self.dimensions) for book in books]
+        document_frequency = np.zeros(self.dimensions, dtype=np.float64)
+        for indices, _ in hashed:
+            document_frequency[indices] += 1
+        documents = max(len(books), 1)
+        idf = (np.log((1.0 + documents) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+        vectors = np.zeros((len(books), self.dimensions), dtype=np.float32)
+        for row, (indices, frequencies) in enumerate(hashed):
+            vectors[row, indices] = frequencies * idf[indices]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms, np.array([book[0] for book in books], dtype=np.int64), document_frequency
+
+    async def _rebuild(self, db: AsyncSession):
+        # Writes are queued from before the books are read: the arrays they would go to are replaced
+        self._building = True
+        try:
+            result = await db.execute(
+                select(Book.id, Book.title, Book.author, Book.genre, Book.summary).order_by(Book.id)
+            )
+            books = result.all()
+            started = time.perf_counter()
+            vectors, book_ids, document_frequency = await asyncio.to_thread(self._build_arrays, books)
+        except BaseException:
+            # The current arrays stay in use, so they get the queued writes instead
+            self._building = False
+            self._replay_pending()
+            raise
+        self._building = False
+        self.vectors, self.book_ids, self.document_frequency = vectors, book_ids, document_frequency
+        self.rows = {int(book_id): row for row, book_id in enumerate(book_ids)}
+        self.built = True
+        # Writes that landed while the arrays were being built
+        self._replay_pending()
+        logger.info(f"Similarity index rebuilt with {len(books)} books in {time.perf_counter() - started:.2f}s")
+        if self.path:
+            await asyncio.to_thread(self.save)
+
+    def _replay_pending(self):
+        pending, self._pending = self._pending, []
+        for action, args in pending:
+            getattr(self, action)(*args)
+
+    async def rebuild(self, db: AsyncSession):
+        """Rebuild the whole index from the books table, then persist it."""
+        async with self._lock:
+            await self._rebuild(db)
+
+    async def ensure_built(self, db: AsyncSession):
+        """Load the persisted index, or build it from the database, on first use."""
+        if not self.built:
+            async with self._lock:
+                if not self.built and not self.load():
+                    await self._rebuild(db)
+
+    # ----------------- incremental updates -----------------
+
+    def upsert(self, book_id: int, title: str, author: Optional[str], genre: Optional[str],
+               summary: Optional[str]):
+        """Add or replace a single book's row."""
+        if self._building:
+            self._pending.append(("upsert", (book_id, title, author, genre, summary)))
+            return
+        if not self.built:
+            return
+        indices, frequencies = hash_features(book_features(title, author, genre, summary), self.dimensions)
+        row = self.rows.get(book_id)
+        if row is None:
+            row = len(self.book_ids)
+            if not self.vectors.flags.writeable or row >= len(self.vectors):
+                # Grow geometrically (this also copies a read-only memory map into private memory)
+                grown = np.zeros((max(16, 2 * len(self.vectors)), self.dimensions), dtype=np.float32)
+                grown[:row] = self.vectors[:row]
+                self.vectors = grown
+            self.book_ids = np.append(self.book_ids, book_id)
+            self.rows[book_id] = row
+        else:
+            if not self.vectors.flags.writeable:
+                self.vectors = np.array(self.vectors)
+            self.document_frequency[np.flatnonzero(self.vectors[row])] -= 1
+        self.document_frequency[indices] += 1
+        self.vectors[row] = self._weighted(indices, frequencies, self._idf())
+
+    def remove(self, book_id: int):
+        """Drop a book; its row is zeroed so it never matches."""
+        if self._building:
+            self._pending.append(("remove", (book_id,)))
+            return
+        row = self.rows.pop(book_id, None)
+        if row is None:
+            return
+        if not self.vectors.flags.writeable:
+            self.vectors = np.array(self.vectors)
+        self.document_frequency[np.flatnonzero(self.vectors[row])] -= 1
+        self.vectors[row] = 0
+        self.book_ids[row] = -1
+
+    def mark_changed(self, book_id: int):
+        """Note a book written by another worker; the next sync() reloads its row."""
+        if self.built or self._building:
+            self._changed.add(book_id)
+
+    async def sync(self, db: AsyncSession):
+        """Reload the rows of the books other workers wrote since the last sync, in one query."""
+        if not self._changed:
+            return
+        changed, self._changed = self._changed, set()
+        try:
+            result = await db.execute(
+                select(Book.id, Book.title, Book.author, Book.genre, Book.summary).where(Book.id.in_(changed))
+            )
+        except Exception:
+            self._changed |= changed
+            raise
+        found = {book[0]: book for book in result.all()}
+        for book_id in changed:
+            if book_id in found:
+                self.upsert(*found[book_id])
+            else:
+                self.remove(book_id)
+
+    # ----------------- queries -----------------
+
+    def similar(self, book_id: int, limit: int = 10) -> list[tuple[int, float]]:
+        """Top-`limit` (book ID, cosine similarity) pairs most similar to a book."""
+        row = self.rows.get(book_id)
+        if row is None:
+            return []
+        count = len(self.book_ids)
+        scores = self.vectors[:count] @ self.vectors[row]
+        scores[row] = -np.inf
+        scores[self.book_ids < 0] = -np.inf
+        limit = min(limit, count - 1)
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.book_ids[index]), float(scores[index])) for index in top if scores[index] > 0]
+
+    # ----------------- persistence -----------------
+
+    def save(self):
+        """Write the index to a new generation directory under SIMILARITY_INDEX_DIR, then make it current.
+
+        The generation is switched by atomically replacing one symlink, so a concurrent load()
+        always reads the vectors, book IDs and document frequencies of a single generation.
+        """
+        generations = os.path.join(self.path, "generations")
+        os.makedirs(generations, exist_ok=True)
+        generation = tempfile.mkdtemp(prefix=f"{time.time_ns()}-", dir=generations)
+        count = len(self.book_ids)
+        arrays = {"vectors": self.vectors[:count], "book_ids": self.book_ids,
+                  "document_frequency": self.document_frequency}
+        for name, array in arrays.items():
+            np.save(os.path.join(generation, f"{name}.npy"), array)
+        link = os.path.join(self.path, f"current.{os.getpid()}.tmp")
+        os.symlink(os.path.relpath(generation, self.path), link)
+        os.replace(link, os.path.join(self.path, "current"))
+        # Keep the previous generation for workers that are loading it right now
+        for name in sorted(os.listdir(generations))[:-2]:
+            shutil.rmtree(os.path.join(generations, name), ignore_errors=True)
+
+    def load(self) -> bool:
+        """Memory-map a persisted index so a new worker starts warm; False if there is none."""
+        if not self.path:
+            return False
+        generation = os.path.realpath(os.path.join(self.path, "current"))
+        try:
+            vectors = np.load(os.path.join(generation, "vectors.npy"), mmap_mode="r")
+            book_ids = np.load(os.path.join(generation, "book_ids.npy"))
+            document_frequency = np.load(os.path.join(generation, "document_frequency.npy"))
+        except FileNotFoundError:
+            # Nothing saved yet, or the generation was pruned while we were reading it
+            return False
+        # Files from another configuration are ignored
+        if vectors.shape != (len(book_ids), self.dimensions):
+            return False
+        self.vectors, self.book_ids, self.document_frequency = vectors, book_ids, document_frequency
+        self.rows = {int(book_id): row for row, book_id in enumerate(self.book_ids) if book_id >= 0}
+        self.built = True
+        logger.info(f"Similarity index loaded from {generation} with {len(self.rows)} books")
+        return True
+
+
+similarity_index = SimilarityIndex(settings.SIMILARITY_DIMENSIONS, settings.SIMILARITY_INDEX_DIR)
+
+
+def _on_book_invalidated(key: str):
+    # Every write to a book refreshes its per-book cache entry ("book:{id}"), which is announced
+    # to the other workers over the cache invalidation channel
+    book_id = key.removeprefix("book:")
+    if book_id.isdigit():
+        similarity_index.mark_changed(int(book_id))
+
+
+redis_client.on_invalidation("book:", _on_book_invalidated)
+
+
+async def run_similarity_refresh():
+    """Rebuild the similarity index every SIMILARITY_REBUILD_INTERVAL seconds (refreshes idf weights).
+
+    A worker that finds a persisted index starts from it and skips the initial rebuild.
+    """
+    warm = similarity_index.load()
+    while True:
+        if not warm:
+            try:
+                async with SessionLocal() as db:
+                    await similarity_index.rebuild(db)
+            except Exception as e:
+                logger.error(f"Similarity index rebuild failed: {e}")
+        warm = False
+        await asyncio.sleep(settings.SIMILARITY_REBUILD_INTERVAL)
+
+
+async def run_similarity_sync():
+    """Apply the books other workers wrote to this worker's index every SIMILARITY_SYNC_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(settings.SIMILARITY_SYNC_INTERVAL)
+        try:
+            # Read from the primary, which already has the write that was announced
+            async with SessionLocal() as db:
+                await similarity_index.sync(db)
+        except Exception as e:
+            logger.error(f"Similarity index sync failed: {e}")
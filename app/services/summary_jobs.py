@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.base import SessionLocal
+from app.models.models import Book
+from app.services import book_services
+from app.services.ai_service import summarize_text, SUMMARIZATION_ERROR
+from app.utility.job_queue import make_job_queue
+from app.utility.rate_limiter import CapacityExhausted
+from app.utility.redis_client import cache_delete_many
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+summary_queue = make_job_queue("summaries")
+
+
+class SummaryGenerationError(Exception):
+    """The LLM did not produce a usable summary."""
+
+
+def _summary_job(book_id: int) -> dict:
+    # One job per book: queueing a book that is already queued is a no-op
+    return {"id": f"book:{book_id}", "book_id": book_id, "attempt": 0}
+
+
+async def enqueue_summary(book_id: int):
+    """Queue a book for background summary generation."""
+    await summary_queue.put(_summary_job(book_id))
+
+
+async def enqueue_summaries(book_ids: list[int]) -> int:
+    """Queue several books for background summary generation at once; returns how many were not queued yet."""
+    return await summary_queue.put_many([_summary_job(book_id) for book_id in book_ids])
+
+
+async def summarize_book(db: AsyncSession, book_id: int):
+    """Generate and store the summary of a book that does not have one yet."""
+    book = await book_services.fetch_book(db, book_id)
+    if not book or book.summary:
+        return book
+    prompt = f"Write a short summary for the book titled '{book.title}' by {book.author}."
+    # Background jobs can afford to queue much longer for LLM capacity than a request
+    summary = await summarize_text(prompt, queue_timeout=settings.LLM_BACKGROUND_QUEUE_TIMEOUT)
+    if summary.startswith(SUMMARIZATION_ERROR):
+        raise SummaryGenerationError(summary)
+    return await book_services.set_book_summary(db, book, summary)
+
+
+async def _mark_failed(book_id: int):
+    async with SessionLocal() as db:
+        book = await book_services.fetch_book(db, book_id)
+        if book:
+            await book_services.set_summary_status(db, book, "failed")
+
+
+async def process_summary_job(job: dict):
+    """Run one summary job, re-queueing it with exponential backoff on failure."""
+    try:
+        async with SessionLocal() as db:
+            await summarize_book(db, job["book_id"])
+    except CapacityExhausted as e:
+        # Not the book's fault: keep it pending and try again once capacity frees up, same attempt
+        logger.info(f"Summary for book {job['book_id']} deferred ({e}), retrying in {e.retry_after:.0f}s")
+        await summary_queue.retry(job, e.retry_after)
+    except Exception as e:
+        if job["attempt"] < settings.SUMMARY_MAX_RETRIES:
+            delay = settings.SUMMARY_RETRY_BACKOFF * 2 ** job["attempt"]
+            logger.warning(f"Summary for book {job['book_id']} failed ({e}), retrying in {delay:.0f}s")
+            await summary_queue.retry({**job, "attempt": job["attempt"] + 1}, delay)
+        else:
+            logger.error(f"Summary for book {job['book_id']} failed after {job['attempt'] + 1} attempts: {e}")
+            await _mark_failed(job["book_id"])
+            await summary_queue.ack(job)
+    else:
+        await summary_queue.ack(job)
+
+
+async def _summary_worker():
+    while True:
+        job = await summary_queue.get()
+        try:
+            await process_summary_job(job)
+        except Exception as e:
+            # The job stays leased, so it is handed out again once the lease runs out
+            logger.error(f"Summary job {job} crashed: {e}")
+
+
+async def requeue_stale_summaries(db: AsyncSession) -> int:
+    """Queue again the books left pending for SUMMARY_STALE_AFTER seconds; returns how many had lost their job.
+
+    Books that still have a job are skipped by the queue, so this only revives jobs that were lost
+    (e.g. to a Redis flush, or with the memory backend of a worker that has exited).
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.SUMMARY_STALE_AFTER)
+    result = await db.execute(select(Book.id).where(
+        Book.summary.is_(None), Book.summary_status == "pending", Book.updated_at < stale_before
+    ))
+    return await enqueue_summaries(result.scalars().all())
+
+
+async def _requeue_stale_summaries_periodically():
+    while True:
+        try:
+            async with SessionLocal() as db:
+                count = await requeue_stale_summaries(db)
+            if count:
+                logger.warning(f"Re-queued {count} pending book(s) whose summary job was lost")
+        except Exception as e:
+            logger.error(f"Stale summary sweep failed: {e}")
+        await asyncio.sleep(settings.SUMMARY_STALE_AFTER)
+
+
+async def run_summary_workers():
+    """Process queued summary jobs with SUMMARY_WORKERS concurrent workers; runs for the app's lifetime."""
+    await asyncio.gather(_requeue_stale_summaries_periodically(),
+                         *(_summary_worker() for _ in range(settings.SUMMARY_WORKERS)))
+
+
+async def enqueue_missing_summaries(db: AsyncSession) -> int:
+    """Queue every book without a summary, pending ones included; returns the number of books found.
+
+    Books whose job is still queued are not queued twice.
+    """
+    result = await db.execute(select(Book.id).where(Book.summary.is_(None)))
+    book_ids = result.scalars().all()
+    if not book_ids:
+        return 0
+    await db.execute(update(Book).where(Book.id.in_(book_ids)).values(summary_status="pending"))
+    await db.commit()
+    await cache_delete_many([book_services.book_cache_key(book_id) for book_id in book_ids])
+    await enqueue_summaries(book_ids)
+    await book_services.invalidate_book_list()
+    return len(book_ids)
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from typing import BinaryIO, Iterator, Optional, Union
+
+FORMATS = ("csv", "jsonl")
+
+
+def detect_format(filename: Optional[str]) -> Optional[str]:
+    """Guess the import format from a file name (.csv, .jsonl or .ndjson)."""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return None
+
+
+def _csv_records(text: io.TextIOBase) -> Iterator[tuple[int, Union[dict, str]]]:
+    for row_number, row in enumerate(csv.DictReader(text), start=1):
+        if None in row:
+            yield row_number, "More values than header columns"
+            continue
+        # Empty cells are missing values, not empty strings
+        yield row_number, {key: value if value != "" else None for key, value in row.items()}
+
+
+def _jsonl_records(text: io.TextIOBase) -> Iterator[tuple[int, Union[dict, str]]]:
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, f"Invalid JSON: {e.msg}"
+            continue
+        yield row_number, record if isinstance(record, dict) else "Expected a JSON object"
+
+
+def iter_records(stream: BinaryIO, fmt: str) -> Iterator[tuple[int, Union[dict, str]]]:
+    """Lazily parse a CSV or JSON Lines byte stream into (row number, record or parse error) pairs.
+
+    Only the current row is held in memory, so arbitrarily large files can be imported.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    records = _csv_records(text) if fmt == "csv" else _jsonl_records(text)
+    try:
+        yield from records
+    finally:
+        # Leave the underlying stream open for its owner
+        text.detach()
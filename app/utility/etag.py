@@ -0,0 +1,24 @@
+from typing import Optional
+
+from fastapi import Response
+
+
+def make_etag(kind: str, resource_id: int, version: Optional[int]) -> Optional[str]:
+    """Strong ETag of a versioned resource (None if the version is unknown)."""
+    if version is None:
+        return None
+    return f'"{kind}-{resource_id}-v{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the current ETag (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response confirming the client's copy is current."""
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor = None
+_semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_CONCURRENCY)
+_stats = {"waiting": 0, "running": 0, "completed": 0, "max_waiting": 0}
+
+
+def verify_password(plain_password, hashed_password):
+    """Verify a plain password against its hashed version (blocking)."""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    """Hash a plain password (blocking)."""
+    return pwd_context.hash(password)
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            # bcrypt releases the GIL while hashing, so threads run it in parallel
+            _executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS,
+                                           thread_name_prefix="bcrypt")
+    return _executor
+
+
+async def _run(func, *args):
+    """Run a blocking hash function in the pool, capping the number of calls in flight."""
+    _stats["waiting"] += 1
+    _stats["max_waiting"] = max(_stats["max_waiting"], _stats["waiting"])
+    try:
+        await _semaphore.acquire()
+    finally:
+        _stats["waiting"] -= 1
+    _stats["running"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+    finally:
+        _stats["running"] -= 1
+        _stats["completed"] += 1
+        _semaphore.release()
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """Verify a password without blocking the event loop."""
+    return await _run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password) -> str:
+    """Hash a password without blocking the event loop."""
+    return await _run(get_password_hash, password)
+
+
+def hash_pool_stats() -> dict:
+    """Queue depth and throughput counters of the password hashing pool."""
+    return {
+        "executor": settings.PASSWORD_HASH_EXECUTOR,
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "max_concurrency": settings.PASSWORD_HASH_MAX_CONCURRENCY,
+        **_stats,
+    }
+
+
+def shutdown_hash_pool():
+    """Stop the worker pool (called on application shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+from app.config import settings
+from app.utility import redis_client
+
+# Queue each job (ARGV: id, body, id, body, ...) unless a job with the same ID is still queued
+_PUT = """
+local added = 0
+for i = 1, #ARGV, 2 do
+    if redis.call("HSETNX", KEYS[1], ARGV[i], ARGV[i + 1]) == 1 then
+        redis.call("RPUSH", KEYS[2], ARGV[i])
+        added = added + 1
+    end
+end
+return added
+"""
+
+# Move the delayed jobs that are due to the ready list, then lease the next ready job: it goes
+# back to the delayed set, due again ARGV[1] seconds from now unless it is acknowledged first,
+# so a job whose worker dies is picked up again instead of being lost.
+_CLAIM = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+for _, id in ipairs(redis.call("ZRANGEBYSCORE", KEYS[3], "-inf", now, "LIMIT", 0, 100)) do
+    redis.call("ZREM", KEYS[3], id)
+    redis.call("RPUSH", KEYS[2], id)
+end
+while true do
+    local id = redis.call("LPOP", KEYS[2])
+    if not id then
+        return false
+    end
+    local job = redis.call("HGET", KEYS[1], id)
+    if job then
+        redis.call("ZADD", KEYS[3], now + tonumber(ARGV[1]), id)
+        return job
+    end
+end
+"""
+
+# Store the job's new body and make it due ARGV[3] seconds from now (replacing its lease)
+_RETRY = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+redis.call("HSET", KEYS[1], ARGV[1], ARGV[2])
+redis.call("ZADD", KEYS[2], now + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+
+class RedisJobQueue:
+    """Durable FIFO job queue in Redis, shared by every worker process.
+
+    Every job has an "id"; putting a job whose ID is still queued is a no-op. Job bodies live in
+    a hash, ready IDs in a list and delayed ones (retries, and jobs leased to a worker) in a
+    sorted set scored by the time they become due. A job stays queued until it is acknowledged,
+    so neither a crash mid-job nor a deploy during a retry's backoff loses it.
+    """
+
+    def __init__(self, name: str):
+        self.jobs_key = f"queue:{name}:jobs"
+        self.ready_key = f"queue:{name}"
+        self.delayed_key = f"queue:{name}:delayed"
+        self.lease_seconds = settings.JOB_LEASE_SECONDS
+        self.poll_interval = settings.JOB_POLL_INTERVAL
+
+    async def put(self, job: dict):
+        """Append a job to the queue."""
+        await self.put_many([job])
+
+    async def put_many(self, jobs: list[dict]) -> int:
+        """Append several jobs in one round trip; returns how many were not already queued."""
+        if not jobs:
+            return 0
+        args = [value for job in jobs for value in (job["id"], json.dumps(job))]
+        return await redis_client.redis.eval(_PUT, 2, self.jobs_key, self.ready_key, *args)
+
+    async def get(self) -> dict:
+        """Wait for the next job and lease it; ack() or retry() it once it has run."""
+        while True:
+            raw = await redis_client.redis.eval(_CLAIM, 3, self.jobs_key, self.ready_key, self.delayed_key,
+                                                self.lease_seconds)
+            if raw:
+                return json.loads(raw)
+            await asyncio.sleep(self.poll_interval)
+
+    async def ack(self, job: dict):
+        """Remove a job that is done with for good."""
+        async with redis_client.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self.jobs_key, job["id"])
+            pipe.zrem(self.delayed_key, job["id"])
+            await pipe.execute()
+
+    async def retry(self, job: dict, delay: float):
+        """Run a job (possibly updated, with the same ID) again after `delay` seconds."""
+        await redis_client.redis.eval(_RETRY, 2, self.jobs_key, self.delayed_key,
+                                      job["id"], json.dumps(job), delay)
+
+    async def size(self) -> int:
+        """Number of jobs waiting."""
+        return await redis_client.redis.llen(self.ready_key)
+
+
+class LocalJobQueue:
+    """In-process FIFO job queue, for single-worker deployments without Redis (jobs die with the process)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._queued_ids = set()
+
+    async def put(self, job: dict):
+        """Append a job to the queue."""
+        await self.put_many([job])
+
+    async def put_many(self, jobs: list[dict]) -> int:
+        """Append several jobs; returns how many were not already queued."""
+        added = 0
+        for job in jobs:
+            if job["id"] not in self._queued_ids:
+                self._queued_ids.add(job["id"])
+                self._queue.put_nowait(job)
+                added += 1
+        return added
+
+    async def get(self) -> dict:
+        """Wait for the next job."""
+        return await self._queue.get()
+
+    async def ack(self, job: dict):
+        """Forget a job that is done with for good."""
+        self._queued_ids.discard(job["id"])
+
+    async def retry(self, job: dict, delay: float):
+        """Run a job (possibly updated, with the same ID) again after `delay` seconds."""
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job)
+
+    async def size(self) -> int:
+        """Number of jobs waiting."""
+        return self._queue.qsize()
+
+
+def make_job_queue(name: str):
+    """Create a job queue using the configured backend ("redis" or "memory")."""
+    if settings.JOB_QUEUE_BACKEND == "memory":
+        return LocalJobQueue(name)
+    return RedisJobQueue(name)
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+# Returned by LocalCache.get() on a miss, since None is a valid cached value
+MISSING = object()
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with a per-entry TTL.
+
+    Values are stored as-is (already decoded), so callers must treat them as read-only.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        """Get a value by key, or MISSING if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        """Store a value, evicting the least recently used entry when full."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        """Drop a key if present."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry."""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counters plus the current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
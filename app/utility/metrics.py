@@ -0,0 +1,123 @@
+"""Prometheus metrics of this worker: HTTP routes, database queries, cache lookups and LLM calls.
+
+Labels are kept low-cardinality (route templates, status classes, statement kinds and cache
+key prefixes; never IDs or raw paths), so a 15 s scrape interval stays cheap.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to serve an HTTP request, by route template",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database statements executed per HTTP request",
+    ["method", "route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Database statement execution time, by statement kind",
+    ["statement"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups, by tier, key prefix and result",
+    ["tier", "prefix", "result"],
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls that reached the provider",
+    ["operation"], buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+LLM_ERRORS = Counter("llm_errors_total", "LLM calls that failed", ["operation"])
+LLM_REJECTED = Counter("llm_rejected_total", "LLM calls turned away for lack of capacity", ["reason"])
+
+_STATEMENTS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE"})
+# Number of statements executed by the current request ([count]), None outside of one
+_request_queries: ContextVar[Optional[list]] = ContextVar("request_queries", default=None)
+
+
+def cache_prefix(key: str) -> str:
+    """Metric label of a cache key: the part before the first colon ("book", "books", "llm", ...)."""
+    return key.split(":", 1)[0]
+
+
+def record_cache_lookup(tier: str, key: str, hit: bool):
+    """Count one cache lookup."""
+    CACHE_LOOKUPS.labels(tier, cache_prefix(key), "hit" if hit else "miss").inc()
+
+
+def _statement_kind(statement: str) -> str:
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return kind if kind in _STATEMENTS else "OTHER"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    DB_QUERY_DURATION.labels(_statement_kind(statement)).observe(time.perf_counter() - started)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and counting the database statements it ran."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        queries = [0]
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so random URLs cannot blow up the series count
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, template, f"{status['code'] // 100}xx").observe(elapsed)
+            HTTP_REQUEST_DB_QUERIES.labels(method, template).observe(queries[0])
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, and its content type.
+
+    With PROMETHEUS_MULTIPROC_DIR set (several uvicorn/gunicorn workers), the values of all
+    worker processes are aggregated.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
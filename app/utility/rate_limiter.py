@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from redis.exceptions import RedisError
+
+from app.utility import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Refill the request and token buckets for the time elapsed, then take one request and
+# ARGV[3] tokens if both are available. Returns "0", or the seconds until they will be.
+# Redis' own clock is used so workers with skewed clocks still share one budget.
+_TAKE = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rpm, tpm, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call("HMGET", KEYS[1], "requests", "tokens", "updated", "blocked_until")
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+local requests = math.min(rpm, (tonumber(state[1]) or rpm) + elapsed * rpm / 60)
+local tokens = math.min(tpm, (tonumber(state[2]) or tpm) + elapsed * tpm / 60)
+-- A call larger than the whole bucket could never run; let it have the full bucket instead
+cost = math.min(cost, tpm)
+local wait = math.max(0, (tonumber(state[4]) or 0) - now)
+if rpm > 0 then wait = math.max(wait, (1 - requests) * 60 / rpm) end
+if tpm > 0 then wait = math.max(wait, (cost - tokens) * 60 / tpm) end
+if wait <= 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+redis.call("HSET", KEYS[1], "requests", requests, "tokens", tokens, "updated", now)
+redis.call("EXPIRE", KEYS[1], 120)
+return tostring(wait)
+"""
+
+# Stop every worker from calling for ARGV[1] seconds (the provider told us to back off)
+_BLOCK = """
+local clock = redis.call("TIME")
+local blocked_until = tonumber(clock[1]) + tonumber(clock[2]) / 1000000 + tonumber(ARGV[1])
+if blocked_until > (tonumber(redis.call("HGET", KEYS[1], "blocked_until")) or 0) then
+    redis.call("HSET", KEYS[1], "blocked_until", blocked_until)
+end
+redis.call("EXPIRE", KEYS[1], math.ceil(tonumber(ARGV[1])) + 120)
+return 1
+"""
+
+# Give back ARGV[3] requests and ARGV[4] tokens taken by _TAKE that a call turned out not to need
+_REFUND = """
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local state = redis.call("HMGET", KEYS[1], "requests", "tokens")
+if not state[1] then
+    return 0
+end
+redis.call("HSET", KEYS[1], "requests", math.min(rpm, tonumber(state[1]) + tonumber(ARGV[3])),
+           "tokens", math.min(tpm, tonumber(state[2]) + tonumber(ARGV[4])))
+return 1
+"""
+
+
+class CapacityExhausted(Exception):
+    """No capacity for an LLM call became available before the caller's deadline."""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(CapacityExhausted):
+    """The requests- or tokens-per-minute budget shared by all workers is spent."""
+    status_code = 429
+
+
+class ConcurrencyExhausted(CapacityExhausted):
+    """Every LLM call slot of this worker stayed busy until the deadline."""
+    status_code = 503
+
+
+class LLMGovernor:
+    """Admission control for LLM calls.
+
+    A per-worker semaphore bounds the calls in flight, and a token bucket in Redis (one for
+    requests and one for tokens per minute) keeps all workers together under the provider's
+    quotas. Callers queue on both until their deadline and then get a CapacityExhausted
+    error instead of a failed upstream call. A limit of 0 disables it.
+    """
+
+    def __init__(self, key: str, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int):
+        self.key = key
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+    async def _reserve(self, tokens: int) -> float:
+        """Take a request and `tokens` tokens from the shared buckets; returns 0, or how long to wait first."""
+        if self.requests_per_minute <= 0 and self.tokens_per_minute <= 0:
+            return 0.0
+        try:
+            return float(await redis_client.redis.eval(
+                _TAKE, 1, self.key, self.requests_per_minute, self.tokens_per_minute, tokens))
+        except RedisError as e:
+            # The local semaphore still bounds the load; better than failing every call
+            logger.warning(f"LLM rate limiter unavailable, admitting call: {e}")
+            return 0.0
+
+    async def penalize(self, seconds: float):
+        """Hold back every worker's calls for `seconds` (the provider throttled us)."""
+        try:
+            await redis_client.redis.eval(_BLOCK, 1, self.key, seconds)
+        except RedisError as e:
+            logger.warning(f"Could not share the LLM provider's back-off: {e}")
+
+    async def refund(self, reserved: int, used: int = 0, requests: int = 0):
+        """Give back the part of the `reserved` tokens taken for a call that it only `used` part of."""
+        # _TAKE charges a call larger than the bucket just the whole bucket
+        tokens = reserved - used if self.tokens_per_minute <= 0 else (
+            min(reserved, self.tokens_per_minute) - min(used, self.tokens_per_minute))
+        if (self.requests_per_minute <= 0 and self.tokens_per_minute <= 0) or (tokens <= 0 and requests <= 0):
+            return
+        try:
+            await redis_client.redis.eval(_REFUND, 1, self.key, self.requests_per_minute, self.tokens_per_minute,
+                                          requests, max(0, tokens))
+        except RedisError as e:
+            logger.warning(f"Could not give back unused LLM rate budget: {e}")
+
+    async def reserve_budget(self, tokens: int, timeout: float):
+        """Wait (at most `timeout` seconds) for a request and `tokens` of the shared rate budget, and take them."""
+        deadline = time.monotonic() + timeout
+        while (wait := await self._reserve(tokens)) > 0:
+            if wait > deadline - time.monotonic():
+                raise RateLimitExceeded(f"LLM rate limit reached, capacity frees up in {wait:.1f}s",
+                                        retry_after=wait)
+            # Jitter so the waiters of all workers do not retry in lockstep
+            await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+    @asynccontextmanager
+    async def call_slot(self, timeout: float) -> AsyncIterator[None]:
+        """Wait (at most `timeout` seconds) for one of this worker's call slots and hold it for the block."""
+        if self._semaphore is not None:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise ConcurrencyExhausted("All LLM call slots are busy", retry_after=1.0)
+        try:
+            yield
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, timeout: float) -> AsyncIterator[None]:
+        """Wait (at most `timeout` seconds) for a call slot and for `tokens` of rate budget."""
+        deadline = time.monotonic() + timeout
+        async with self.call_slot(timeout):
+            await self.reserve_budget(tokens, deadline - time.monotonic())
+            yield
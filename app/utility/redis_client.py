@@ -1,25 +1,286 @@
+import asyncio
 import json
-from redis import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable
 
-redis = asyncio.Redis.from_url(
+from redis import asyncio as aioredis
+
+from app.config import settings
+from app.utility.local_cache import LocalCache, MISSING
+from app.utility.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+redis = aioredis.Redis.from_url(
     "redis://localhost:6379",
     decode_responses=True
 )
 
+# Optional in-process tier in front of Redis, kept coherent across workers through pub/sub
+local_cache = LocalCache(settings.L1_CACHE_MAX_ENTRIES, settings.L1_CACHE_TTL) if settings.L1_CACHE_ENABLED else None
+INVALIDATION_CHANNEL = "cache:invalidate"
+_WORKER_ID = uuid.uuid4().hex
+_redis_stats = {"hits": 0, "misses": 0}
+# (key prefix, callback) pairs told about the keys other workers change
+_invalidation_handlers: list[tuple[str, Callable[[str], None]]] = []
+
+# Delete a lock only if it is still held by the caller's token
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _local_get(key: str):
+    if local_cache is None:
+        return MISSING
+    value = local_cache.get(key)
+    record_cache_lookup("l1", key, value is not MISSING)
+    return value
+
+
+def _local_set(key: str, value):
+    if local_cache is not None:
+        local_cache.set(key, value)
+
+
+def _local_delete(key: str):
+    if local_cache is not None:
+        local_cache.delete(key)
+
+
+def _notify_peers(pipe, key: str):
+    """Queue an invalidation message so other workers drop their local copy of key."""
+    if local_cache is not None or _invalidation_handlers:
+        pipe.publish(INVALIDATION_CHANNEL, f"{_WORKER_ID}:{key}")
+
+
+def on_invalidation(prefix: str, handler: Callable[[str], None]):
+    """Call handler(key) whenever another worker writes or deletes a cached key starting with prefix."""
+    _invalidation_handlers.append((prefix, handler))
+
+
+def _handle_invalidation(message: str):
+    sender, _, key = message.partition(":")
+    if sender == _WORKER_ID:
+        return
+    _local_delete(key)
+    for prefix, handler in _invalidation_handlers:
+        if key.startswith(prefix):
+            handler(key)
+
+
+async def _redis_get(key: str):
+    """Get and decode a raw value from Redis, counting hits and misses."""
+    cached = await redis.get(key)
+    record_cache_lookup("redis", key, cached is not None)
+    if cached is None:
+        _redis_stats["misses"] += 1
+        return None
+    _redis_stats["hits"] += 1
+    return json.loads(cached)
+
 
 async def cache_get(key: str):
     """Get cached value by key"""
-    cached = await redis.get(key)
-    if cached:
-        return json.loads(cached)
-    return None
+    value = _local_get(key)
+    if value is not MISSING:
+        return value
+    value = await _redis_get(key)
+    if value is not None:
+        _local_set(key, value)
+    return value
+
+
+async def cache_get_many(keys: list[str]) -> list:
+    """Get several cached values at once (None for misses): the local tier, then one MGET for the rest"""
+    values = [_local_get(key) for key in keys]
+    remote = [i for i, value in enumerate(values) if value is MISSING]
+    raw_values = await redis.mget([keys[i] for i in remote]) if remote else []
+    for i, raw in zip(remote, raw_values):
+        record_cache_lookup("redis", keys[i], raw is not None)
+        _redis_stats["hits" if raw is not None else "misses"] += 1
+        values[i] = json.loads(raw) if raw is not None else None
+        if raw is not None:
+            _local_set(keys[i], values[i])
+    return values
+
+
+async def cache_set(key: str, value, ttl: int = 300, notify: bool = True):
+    """Set cached value by key with optional TTL (default 5 minutes)
 
+    Read-through fills pass notify=False: they store what every worker would load anyway, so the
+    other workers keep their local copies. Only writes that change the value tell them.
+    """
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.set(key, json.dumps(value), ex=ttl)
+        if notify:
+            _notify_peers(pipe, key)
+        await pipe.execute()
+    _local_set(key, value)
 
-async def cache_set(key: str, value, ttl: int = 300):
-    """Set cached value by key with optional TTL (default 5 minutes)"""
-    await redis.set(key, json.dumps(value), ex=ttl)
+
+async def cache_set_many(values: dict, ttl: int = 300, notify: bool = True):
+    """Set several cached values, all with the same TTL, in a single round trip (notify as for cache_set)"""
+    if not values:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        for key, value in values.items():
+            pipe.set(key, json.dumps(value), ex=ttl)
+            if notify:
+                _notify_peers(pipe, key)
+        await pipe.execute()
+    for key, value in values.items():
+        _local_set(key, value)
 
 
 async def cache_delete(key: str):
     """Delete cached value by key"""
-    await redis.delete(key)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.delete(key)
+        _notify_peers(pipe, key)
+        await pipe.execute()
+    _local_delete(key)
+
+
+async def cache_delete_many(keys: list[str]):
+    """Delete several cached values in a single round trip"""
+    if not keys:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.delete(*keys)
+        for key in keys:
+            _notify_peers(pipe, key)
+        await pipe.execute()
+    for key in keys:
+        _local_delete(key)
+
+
+async def cache_set_bounded(key: str, value, index: str, max_entries: int, ttl: int = 300):
+    """Set cached value by key, keeping at most max_entries keys tracked in the index sorted set"""
+    await cache_set(key, value, ttl=ttl)
+    now = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        # Forget keys that have expired on their own, then record this one
+        pipe.zremrangebyscore(index, 0, now - ttl)
+        pipe.zadd(index, {key: now})
+        pipe.zcard(index)
+        *_, size = await pipe.execute()
+    if size > max_entries:
+        for evicted_key, _ in await redis.zpopmin(index, size - max_entries):
+            await cache_delete(evicted_key)
+
+
+async def cache_version(namespace: str) -> int:
+    """Get the current version of a cache namespace (0 if never bumped)"""
+    version = await cache_get(f"{namespace}:version")
+    return int(version) if version is not None else 0
+
+
+async def cache_bump_version(namespace: str) -> int:
+    """Invalidate every key of a namespace at once by bumping its version"""
+    key = f"{namespace}:version"
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.incr(key)
+        _notify_peers(pipe, key)
+        version, *_ = await pipe.execute()
+    _local_delete(key)
+    return version
+
+
+def cache_stats() -> dict:
+    """Hit, miss and eviction counters of each cache tier in this worker."""
+    return {
+        "l1": local_cache.stats() if local_cache is not None else None,
+        "redis": dict(_redis_stats),
+    }
+
+
+async def listen_for_invalidations():
+    """Drop local entries changed by other workers and notify the handlers; runs for the lifetime of the app."""
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages sent while we were not subscribed are lost, so start from a clean slate
+            if local_cache is not None:
+                local_cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    _handle_invalidation(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Cache invalidation listener disconnected: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def _should_refresh(entry: dict, beta: float) -> bool:
+    """Decide whether to rebuild an entry early (probabilistic early expiration, "XFetch").
+
+    The closer the entry is to expiring and the longer it took to compute, the more likely a
+    caller is picked to refresh it, so rebuilds are spread out instead of all landing at expiry.
+    """
+    jitter = -entry["delta"] * beta * math.log(1.0 - random.random())
+    return time.time() + jitter >= entry["expires_at"]
+
+
+async def _compute_and_store(key: str, compute: Callable[[], Awaitable[Any]], ttl: int, stale_ttl: int):
+    """Run compute() and store its result together with the metadata used for early refresh."""
+    started = time.time()
+    value = await compute()
+    finished = time.time()
+    entry = {"value": value, "delta": finished - started, "expires_at": finished + ttl}
+    # Keep the payload around past its logical expiry so it can be served stale during a rebuild
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.set(key, json.dumps(entry), ex=ttl + stale_ttl)
+        _notify_peers(pipe, key)
+        await pipe.execute()
+    _local_set(key, entry)
+    return value
+
+
+async def get_or_compute(key: str, compute: Callable[[], Awaitable[Any]], ttl: int = 300,
+                         stale_ttl: int = 60, lock_ttl: int = 10, wait_timeout: float = 5.0,
+                         beta: float = 1.0):
+    """Get cached value by key, rebuilding it with compute() under a single-flight lock.
+
+    Only the caller holding the short rebuild lock runs compute(); the others are served the stale
+    copy if there is one, or wait for the rebuilt value otherwise.
+    """
+    entry = _local_get(key)
+    if entry is MISSING:
+        entry = await _redis_get(key)
+        if entry is not None:
+            _local_set(key, entry)
+    if entry is not None and not _should_refresh(entry, beta):
+        return entry["value"]
+
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    if await redis.set(lock_key, token, nx=True, ex=lock_ttl):
+        try:
+            return await _compute_and_store(key, compute, ttl, stale_ttl)
+        finally:
+            await redis.eval(_RELEASE_LOCK, 1, lock_key, token)
+
+    if entry is not None:
+        return entry["value"]
+
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        raw = await redis.get(key)
+        if raw is not None:
+            return json.loads(raw)["value"]
+
+    # The lock holder is too slow or died; stop waiting and rebuild ourselves
+    return await _compute_and_store(key, compute, ttl, stale_ttl)
@@ -0,0 +1,178 @@
+"""Per-request SQL profiler for development and staging (SQL_PROFILING=true).
+
+Every statement a request runs is recorded with its duration and the application function
+that issued it. Statements repeated SQL_PROFILE_REPEAT_THRESHOLD times or more within one
+request are flagged as likely N+1 patterns.
+"""
+import hashlib
+import logging
+import os
+import sys
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-SQL-Profile"
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frames from these packages are plumbing, never the caller we want to report
+_SKIPPED_DIRS = tuple(os.path.join(_APP_DIR, name) + os.sep for name in ("db", "utility"))
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    duration: float
+    caller: str
+    # Hash of the bound parameters, to tell identical executions from N+1 lookups
+    parameters: str
+
+
+@dataclass
+class QueryProfile:
+    """Statements executed while a profile was active."""
+    label: str = ""
+    queries: list[QueryRecord] = field(default_factory=list)
+    # Enclosing profile (e.g. a test's query budget around a profiled request), which sees the same statements
+    parent: Optional["QueryProfile"] = None
+
+    def total_time(self) -> float:
+        return sum(query.duration for query in self.queries)
+
+    def repeated(self, threshold: Optional[int] = None) -> list[dict]:
+        """Statements executed at least `threshold` times, most frequent first."""
+        threshold = threshold or settings.SQL_PROFILE_REPEAT_THRESHOLD
+        counts = Counter(query.statement for query in self.queries)
+        repeated = []
+        for statement, count in counts.most_common():
+            if count < threshold:
+                break
+            runs = [query for query in self.queries if query.statement == statement]
+            repeated.append({
+                "statement": statement,
+                "count": count,
+                # Equal to count for a classic N+1; lower when the very same query is simply re-run
+                "distinct_parameters": len({query.parameters for query in runs}),
+                "callers": sorted({query.caller for query in runs}),
+            })
+        return repeated
+
+    def header(self) -> str:
+        """Compact one-line summary, sent as the X-SQL-Profile response header."""
+        return (f"queries={len(self.queries)}; time_ms={self.total_time() * 1000:.1f}; "
+                f"repeated={len(self.repeated())}")
+
+    def summary(self) -> dict:
+        return {
+            "label": self.label,
+            "query_count": len(self.queries),
+            "total_ms": round(self.total_time() * 1000, 3),
+            "repeated": self.repeated(),
+            "queries": [
+                {"statement": query.statement, "ms": round(query.duration * 1000, 3), "caller": query.caller}
+                for query in self.queries
+            ],
+        }
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("sql_profile", default=None)
+# Most recent request profiles of this worker, served by GET /debug/sql-profiles
+recent_profiles: deque = deque(maxlen=settings.SQL_PROFILE_HISTORY)
+
+
+def _caller() -> str:
+    """The innermost application function (outside app/db and app/utility) running the statement.
+
+    Async sessions execute statements in a greenlet whose stack ends at SQLAlchemy; the awaiting
+    coroutines are on the stack of its parent greenlet, so the walk continues there.
+    """
+    frame = sys._getframe(2)
+    current = greenlet.getcurrent()
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and not filename.startswith(_SKIPPED_DIRS):
+            module = os.path.relpath(filename, os.path.dirname(_APP_DIR))
+            return f"{module}:{frame.f_code.co_name}"
+        frame = frame.f_back
+        if frame is None and current.parent is not None:
+            current = current.parent
+            frame = current.gr_frame
+    return "unknown"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is None or not conn.info.get("profile_started"):
+        return
+    duration = time.perf_counter() - conn.info["profile_started"].pop()
+    # Only a digest of the parameters is kept, so passwords and tokens never end up in a profile
+    digest = hashlib.sha1(repr(parameters).encode()).hexdigest()[:16]
+    record = QueryRecord(" ".join(statement.split()), duration, _caller(), digest)
+    while profile is not None:
+        profile.queries.append(record)
+        profile = profile.parent
+
+
+def instrument(engine: AsyncEngine):
+    """Let the profiler see the statements of an engine (a no-op unless a profile is active)."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def profile_queries(label: str = "") -> Iterator[QueryProfile]:
+    """Record the statements run by instrumented engines inside the block (tasks started in it included)."""
+    profile = QueryProfile(label, parent=_current_profile.get())
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+class SqlProfilerMiddleware:
+    """ASGI middleware profiling each request while SQL_PROFILING is on.
+
+    Adds the X-SQL-Profile header (statements run before the response started), logs likely
+    N+1 patterns and keeps the full profile for GET /debug/sql-profiles.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.SQL_PROFILING:
+            return await self.app(scope, receive, send)
+
+        with profile_queries(f"{scope['method']} {scope['path']}") as profile:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", ()),
+                                          (PROFILE_HEADER.lower().encode(), profile.header().encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    profile.label = f"{scope['method']} {route.path}"
+                for repeated in profile.repeated():
+                    logger.warning(f"Possible N+1 in {profile.label}: {repeated['count']}x "
+                                   f"{repeated['statement'][:200]} from {', '.join(repeated['callers'])}")
+                recent_profiles.append(profile.summary())
@@ -0,0 +1,114 @@
+"""Book list microbenchmark: CPU per GET /books request served from the cache.
+
+Compares the two ways a cached page can be turned into a response, over a synthetic catalog
+(10k books by default) walked page by page:
+
+- "validated": the page is cached as a list of dicts, which FastAPI re-validates through
+  response_model=list[BookOut] and encodes again on every request (the previous behaviour);
+- "pre_serialized": the page is cached as the JSON body produced once by
+  book_services.serialize_books, and sent as it is in a raw Response (the current behaviour).
+
+Both include decoding the cache entry, as a Redis hit does. Prints CPU time per request and
+for the whole list as JSON.
+
+Usage:
+    python -m benchmarks.bench_book_list [--books 10000] [--page-size 200] [--rounds 20]
+    python -m benchmarks.bench_book_list --page-size 10000   # the whole catalog in one response
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from app.main import app
+from app.services.book_services import serialize_books
+
+GENRES = ["Fiction", "Mystery", "Fantasy", "Science Fiction", "Romance", "History", None]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_books(count: int) -> list[dict]:
+    """Books as Book.to_dict() returns them, with summaries of realistic length."""
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(5000)]
+    return [
+        {"id": book_id, "title": " ".join(rng.choices(words, k=4)).title(), "author": f"Author {book_id % 997}",
+         "genre": rng.choice(GENRES), "year_published": rng.randint(1900, 2024),
+         "summary": " ".join(rng.choices(words, k=60)), "summary_status": "ready"}
+        for book_id in range(1, count + 1)
+    ]
+
+
+async def validated(raw_entry: str, field) -> bytes:
+    items = json.loads(raw_entry)["value"]["items"]
+    content = await serialize_response(field=field, response_content=items)
+    return JSONResponse(content).body
+
+
+async def pre_serialized(raw_entry: str, field) -> bytes:
+    body = json.loads(raw_entry)["value"]["body"]
+    return Response(content=body, media_type="application/json").body
+
+
+async def measure(path, entries: list[str], field, rounds: int) -> dict:
+    cpu = []
+    for _ in range(rounds):
+        for raw_entry in entries:
+            started = time.process_time()
+            await path(raw_entry, field)
+            cpu.append((time.process_time() - started) * 1e6)
+    return {
+        "requests": len(cpu),
+        "cpu_us_mean": round(statistics.mean(cpu), 1),
+        "cpu_us_p50": round(statistics.median(cpu), 1),
+        "cpu_us_p95": round(_percentile(cpu, 95), 1),
+        "cpu_ms_whole_list": round(statistics.mean(cpu) * len(entries) / 1000, 2),
+    }
+
+
+async def main(books: int, page_size: int, rounds: int) -> dict:
+    route = next(route for route in app.routes if getattr(route, "path", None) == "/books/"
+                 and "GET" in route.methods)
+    catalog = make_books(books)
+    pages = [catalog[first:first + page_size] for first in range(0, books, page_size)]
+
+    # Cache entries as get_or_compute stores them
+    list_entries = [json.dumps({"value": {"items": page, "next_cursor": None}}) for page in pages]
+    started = time.process_time()
+    body_entries = [json.dumps({"value": {"body": serialize_books(page), "next_cursor": None}}) for page in pages]
+    fill_ms = (time.process_time() - started) * 1000
+
+    # Both paths must send the same document
+    assert json.loads(await validated(list_entries[0], route.response_field)) == \
+        json.loads(await pre_serialized(body_entries[0], route.response_field))
+
+    results = {
+        "books": books,
+        "page_size": page_size,
+        "pages": len(pages),
+        "validated": await measure(validated, list_entries, route.response_field, rounds),
+        "pre_serialized": await measure(pre_serialized, body_entries, route.response_field, rounds),
+        # Paid once per page and cache fill instead of on every request
+        "pre_serialize_fill_ms_whole_list": round(fill_ms, 2),
+    }
+    results["speedup"] = round(results["validated"]["cpu_us_mean"] / results["pre_serialized"]["cpu_us_mean"], 1)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=10_000, help="Number of books in the catalog")
+    parser.add_argument("--page-size", type=int, default=200, help="Books per response")
+    parser.add_argument("--rounds", type=int, default=20, help="Times the whole list is requested")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.books, args.page_size, args.rounds)), indent=2))
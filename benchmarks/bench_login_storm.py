@@ -0,0 +1,129 @@
+"""Login storm benchmark: how responsive is the rest of the API while many logins are verified?
+
+Fires a burst of concurrent POST /auth/login requests (the bcrypt check dominates their cost)
+and, at the same time, keeps probing GET /health_check, all through the ASGI app with
+httpx.ASGITransport. The signed-up user lives in a throwaway SQLite database and Redis is
+replaced by fakeredis. Runs the burst twice, once with the login handler verifying inline on the
+event loop as it used to, once through the hashing worker pool, and prints login throughput plus
+probe latency percentiles for each mode as JSON.
+
+Usage:
+    python -m benchmarks.bench_login_storm [--logins 64] [--probe-interval 0.01]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+EMAIL = "storm@bench.local"
+PASSWORD = "bench-password"
+
+
+async def _verify_inline(password, hashed):
+    from app.utility.hashing import verify_password
+
+    return verify_password(password, hashed)
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def seed():
+    """Create the tables and the user every login of the storm signs in as."""
+    from app.db.base import Base, engine, SessionLocal
+    from app.models.models import User
+    from app.utility.hashing import get_password_hash
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        session.add(User(username="storm", email=EMAIL, hashed_password=get_password_hash(PASSWORD)))
+        await session.commit()
+
+
+async def run_storm(client, logins: int, probe_interval: float) -> dict:
+    probe_latencies = []
+    probe_finished_at = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/health_check")
+            probe_latencies.append((time.perf_counter() - started) * 1000)
+            probe_finished_at.append(time.perf_counter())
+            await asyncio.sleep(probe_interval)
+        probe_finished_at.append(time.perf_counter())
+
+    async def login():
+        response = await client.post("/auth/login", data={"username": EMAIL, "password": PASSWORD})
+        return response.status_code
+
+    prober = asyncio.create_task(probe())
+    await asyncio.sleep(probe_interval * 5)
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await prober
+
+    # Longest stretch without any probe being answered: how long the API was frozen
+    gaps = [later - earlier for earlier, later in zip(probe_finished_at, probe_finished_at[1:])]
+    return {
+        "logins": logins,
+        "login_errors": sum(status != 200 for status in statuses),
+        "login_throughput_per_s": round(logins / elapsed, 1),
+        "storm_seconds": round(elapsed, 3),
+        "probes": len(probe_latencies),
+        "probe_p50_ms": round(statistics.median(probe_latencies), 2),
+        "probe_p99_ms": round(_percentile(probe_latencies, 99), 2),
+        "probe_max_ms": round(max(probe_latencies), 2),
+        "max_stall_ms": round(max(gaps) * 1000, 2),
+    }
+
+
+async def main(logins: int, probe_interval: float) -> dict:
+    import fakeredis
+    from httpx import AsyncClient, ASGITransport
+
+    from app.api.routers import auth
+    from app.db.base import engine
+    from app.main import app
+    from app.utility import redis_client
+    from app.utility.hashing import hash_pool_stats, verify_password_async
+
+    redis_client.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await seed()
+
+    results = {}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        for mode, verify in (("inline", _verify_inline), ("pool", verify_password_async)):
+            # The login handler looks the function up in its module at call time
+            auth.verify_password_async = verify
+            results[mode] = await run_storm(client, logins, probe_interval)
+    auth.verify_password_async = verify_password_async
+    results["pool_stats"] = hash_pool_stats()
+    await engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64, help="Number of concurrent logins in the burst")
+    parser.add_argument("--probe-interval", type=float, default=0.01, help="Seconds between health probes")
+    args = parser.parse_args()
+
+    # The app reads its settings at import time, so point it at a throwaway database first
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='bench_login_')}/bench.db"
+    os.environ["DATABASE_REPLICA_URLS"] = ""
+    os.environ["SIMILARITY_INDEX_DIR"] = ""
+    # Per-request INFO logs would cost more than the health probes being measured
+    logging.disable(logging.INFO)
+
+    print(json.dumps(asyncio.run(main(args.logins, args.probe_interval)), indent=2))
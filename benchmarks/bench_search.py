@@ -0,0 +1,127 @@
+"""Search benchmark: full-text query latency over a large synthetic catalog.
+
+Seeds a catalog of random titles, authors and summaries, then times a mix of one-, two- and
+three-word searches and prints latency percentiles as JSON. The "postgres" backend seeds the
+`books` table of --database-url (point it at a scratch database: the table is truncated) and
+queries it through the GIN-indexed search vector, exactly like GET /books/search. The "memory"
+backend measures the in-process inverted index used on SQLite.
+
+Usage:
+    python -m benchmarks.bench_search --backend postgres --database-url postgresql+asyncpg://... [--rows 1000000]
+    python -m benchmarks.bench_search --backend memory [--rows 1000000] [--queries 200]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.db.base import Base
+from app.services import book_services
+from app.services.search_index import SearchIndex
+
+# Zipf-like vocabulary: a few very common words and a long tail of rare ones
+VOCABULARY = [f"word{i}" for i in range(20000)] + [
+    "dragon", "garden", "winter", "empire", "mystery", "ocean", "shadow", "river", "king", "war",
+]
+WEIGHTS = [1.0 / (rank + 1) for rank in range(len(VOCABULARY))]
+random.Random(0).shuffle(WEIGHTS)
+CUMULATIVE_WEIGHTS = list(itertools.accumulate(WEIGHTS))
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUMULATIVE_WEIGHTS, k=count))
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _queries(count: int) -> list[str]:
+    rng = random.Random(1)
+    return [_words(rng, rng.choice([1, 2, 3])) for _ in range(count)]
+
+
+def _report(backend: str, rows: int, seed_seconds: float, latencies: list, hits: list) -> dict:
+    return {
+        "backend": backend,
+        "rows": rows,
+        "seed_seconds": round(seed_seconds, 1),
+        "queries": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "mean_hits_per_page": round(statistics.mean(hits), 1),
+    }
+
+
+def bench_memory(rows: int, queries: int, limit: int) -> dict:
+    rng = random.Random(0)
+    started = time.perf_counter()
+    index = SearchIndex()
+    index._build((book_id, _words(rng, 4), f"Author {book_id % 5000}", _words(rng, 30))
+                 for book_id in range(1, rows + 1))
+    index.built = True
+    seed_seconds = time.perf_counter() - started
+
+    latencies, hits = [], []
+    for query in _queries(queries):
+        started = time.perf_counter()
+        hits.append(len(index.search(query, 0, limit)))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return _report("memory", rows, seed_seconds, latencies, hits)
+
+
+async def bench_postgres(database_url: str, rows: int, queries: int, limit: int) -> dict:
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text("TRUNCATE books CASCADE"))
+
+    started = time.perf_counter()
+    rng = random.Random(0)
+    batch = 10000
+    async with engine.begin() as conn:
+        for first in range(0, rows, batch):
+            await conn.execute(
+                text("INSERT INTO books (title, author, genre, year_published, summary, summary_status) "
+                     "VALUES (:title, :author, 'Fiction', 2000, :summary, 'ready')"),
+                [{"title": _words(rng, 4), "author": f"Author {book_id % 5000}", "summary": _words(rng, 30)}
+                 for book_id in range(first, min(first + batch, rows))],
+            )
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE books"))
+    seed_seconds = time.perf_counter() - started
+
+    latencies, hits = [], []
+    async with AsyncSession(engine) as session:
+        for query in _queries(queries):
+            started = time.perf_counter()
+            hits.append(len(await book_services._search_book_ids(session, query, 0, limit)))
+            latencies.append((time.perf_counter() - started) * 1000)
+    await engine.dispose()
+    return _report("postgres", rows, seed_seconds, latencies, hits)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["postgres", "memory"], default="memory")
+    parser.add_argument("--database-url", help="Scratch Postgres database (required for --backend postgres)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of books in the catalog")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed searches")
+    parser.add_argument("--limit", type=int, default=20, help="Page size of each search")
+    args = parser.parse_args()
+    if args.backend == "postgres":
+        if not args.database_url:
+            parser.error("--database-url is required for the postgres backend")
+        result = asyncio.run(bench_postgres(args.database_url, args.rows, args.queries, args.limit))
+    else:
+        result = bench_memory(args.rows, args.queries, args.limit)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,26 @@
+"""Assertion and parsing helpers shared by the test modules."""
+import json
+from contextlib import contextmanager
+
+import pytest
+
+from app.utility import sql_profiler
+
+
+def parse_sse(body: str) -> list:
+    """Split a server-sent events body into (event, data) pairs."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Fail the test if the block runs more than `limit` SQL statements, listing the ones it ran."""
+    with sql_profiler.profile_queries() as profile:
+        yield profile
+    if len(profile.queries) > limit:
+        statements = "\n".join(f"  {query.caller}: {query.statement}" for query in profile.queries)
+        pytest.fail(f"Expected at most {limit} SQL statements, got {len(profile.queries)}:\n{statements}")
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.api.routers.auth import user_cache_key
+from app.models.models import User
+from app.utility.hashing import get_password_hash_async, verify_password_async, hash_pool_stats
+from app.utility.redis_client import cache_get
+
+
+@pytest.mark.asyncio
+class TestAuth:
+
+    async def test_user_cached_after_request(self, client: AsyncClient, test_user: User, auth_headers: dict):
+        """Test that an authenticated request leaves the user in the cache."""
+        response = await client.get("/books/", headers=auth_headers)
+        assert response.status_code == 200
+
+        cached = await cache_get(user_cache_key(test_user.id))
+        assert cached["email"] == test_user.email
+
+    async def test_deleted_user_evicted(self, client: AsyncClient, db_session, test_user: User, auth_headers: dict):
+        """Test that deleting a user evicts it from the cache so its token stops working."""
+        await client.get("/books/", headers=auth_headers)
+
+        await db_session.delete(test_user)
+        await db_session.commit()
+        # Eviction runs as a task scheduled by the commit
+        await asyncio.sleep(0.1)
+
+        response = await client.get("/books/", headers=auth_headers)
+        assert response.status_code == 401
+
+    async def test_invalid_token_rejected(self, client: AsyncClient):
+        """Test that a token with a bad signature is rejected."""
+        response = await client.get("/books/", headers={"Authorization": "Bearer not-a-jwt"})
+        assert response.status_code == 401
+
+    async def test_password_hashing_in_pool(self):
+        """Test that the pooled hash functions round-trip and are counted."""
+        completed = hash_pool_stats()["completed"]
+        hashed = await get_password_hash_async("secret")
+
+        assert await verify_password_async("secret", hashed)
+        assert not await verify_password_async("wrong", hashed)
+        assert hash_pool_stats()["completed"] == completed + 3
@@ -1,7 +1,13 @@
+import asyncio
+import threading
+
 import pytest
 from httpx import AsyncClient
 
 from app.models.models import Book
+from app.schemas.schemas import BookOut
+from app.services.search_index import SearchIndex
+from app.services.summary_jobs import summarize_book
 
 
 @pytest.mark.asyncio
@@ -26,6 +32,37 @@ class TestBooks:
         assert data["author"] == "Author Name"
         assert data["genre"] == "Science Fiction"
 
+    async def test_create_book_summary_in_background(
+            self,
+            client: AsyncClient,
+            db_session,
+            auth_headers: dict,
+            fake_llm
+    ):
+        """Test that a book without a summary is returned at once and summarized by the job."""
+        response = await client.post(
+            "/books/",
+            headers=auth_headers,
+            json={
+                "title": "Unsummarized Book",
+                "author": "Author Name",
+                "genre": "Fiction",
+                "year_published": 2024,
+                "summary": None
+            }
+        )
+        assert response.status_code == 200
+        book = response.json()
+        assert book["summary_status"] == "pending"
+        assert fake_llm.calls == 0
+
+        await summarize_book(db_session, book["id"])
+
+        status = await client.get(f"/books/{book['id']}/summary-status", headers=auth_headers)
+        assert status.status_code == 200
+        assert status.json()["summary_status"] == "ready"
+        assert status.json()["summary"] == "Summary #1"
+
     async def test_create_book_without_auth(self, client: AsyncClient):
         """Test book creation without authentication."""
         response = await client.post(
@@ -47,6 +84,166 @@ class TestBooks:
         assert isinstance(data, list)
         assert len(data) >= 1
 
+    async def test_cached_book_list_matches_response_model(self, client: AsyncClient, test_book: Book,
+                                                           auth_headers: dict):
+        """Test that a page sent pre-serialized from the cache has exactly the BookOut shape."""
+        first = await client.get("/books/", headers=auth_headers)
+        cached = await client.get("/books/", headers=auth_headers)
+        assert cached.headers["content-type"] == "application/json"
+        assert cached.json() == first.json() == [BookOut.model_validate(test_book).model_dump(mode="json")]
+
+    async def test_list_books_paginated(self, client: AsyncClient, auth_headers: dict):
+        """Test walking the book list with keyset cursors."""
+        for i in range(3):
+            await client.post(
+                "/books/",
+                headers=auth_headers,
+                json={
+                    "title": f"Paged Book {i}",
+                    "author": "Author Name",
+                    "genre": "Fiction",
+                    "year_published": 2024,
+                    "summary": "A paged book"
+                }
+            )
+
+        first = await client.get("/books/", params={"limit": 2}, headers=auth_headers)
+        assert first.status_code == 200
+        assert len(first.json()) == 2
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = await client.get("/books/", params={"limit": 2, "after": cursor}, headers=auth_headers)
+        assert second.status_code == 200
+        assert len(second.json()) == 1
+        assert "X-Next-Cursor" not in second.headers
+        assert second.json()[0]["id"] > first.json()[-1]["id"]
+
+    async def test_list_books_invalid_cursor(self, client: AsyncClient, auth_headers: dict):
+        """Test that a malformed cursor is rejected."""
+        response = await client.get("/books/", params={"after": "not-a-cursor!"}, headers=auth_headers)
+        assert response.status_code == 400
+
+    async def test_search_books(self, client: AsyncClient, db_session, auth_headers: dict):
+        """Test ranked, paginated full-text search, including books written after the first search."""
+        db_session.add_all([
+            Book(title="Dragons of Autumn", author="Weis", genre="Fantasy", year_published=1984,
+                 summary="Heroes gather again."),
+            Book(title="A Quiet Garden", author="Smith", genre="Fiction", year_published=2001,
+                 summary="An old gardener remembers the dragons of his childhood."),
+            Book(title="Cooking at Home", author="Lee", genre="Food", year_published=2010, summary="Recipes."),
+        ])
+        await db_session.commit()
+
+        first = await client.get("/books/search", params={"q": "dragon", "limit": 1}, headers=auth_headers)
+        assert first.status_code == 200
+        # A title match outranks a summary match
+        assert [book["title"] for book in first.json()] == ["Dragons of Autumn"]
+        second = await client.get("/books/search", params={"q": "dragon", "limit": 1,
+                                                           "after": first.headers["X-Next-Cursor"]},
+                                  headers=auth_headers)
+        assert [book["title"] for book in second.json()] == ["A Quiet Garden"]
+        assert "X-Next-Cursor" not in second.headers
+
+        await client.post("/books/", headers=auth_headers, json={
+            "title": "Dragon Cooking", "author": "Lee", "genre": "Food", "year_published": 2020, "summary": "Spicy."
+        })
+        response = await client.get("/books/search", params={"q": "cooking dragon"}, headers=auth_headers)
+        assert [book["title"] for book in response.json()] == ["Dragon Cooking"]
+
+    async def test_search_index_writes_during_rebuild(self, db_session, monkeypatch):
+        """Test that writes landing during a rebuild are queued, not applied to the old index, then replayed."""
+        db_session.add(Book(title="Dragons of Autumn", author="Weis", genre="Fantasy", year_published=1984))
+        await db_session.commit()
+        index = SearchIndex()
+        await index.rebuild(db_session)
+        started, release = threading.Event(), threading.Event()
+        build = SearchIndex._build
+
+        def slow_build(fresh, books):
+            started.set()
+            release.wait(5)
+            build(fresh, books)
+
+        monkeypatch.setattr(SearchIndex, "_build", slow_build)
+        rebuild = asyncio.create_task(index.rebuild(db_session))
+        await asyncio.to_thread(started.wait, 5)
+        index.upsert(99, "Dragon Cooking", "Lee", None)
+        index.remove(1)
+        # The old index is left alone while the fresh one is built
+        assert index.search("dragon") == [1]
+
+        release.set()
+        await rebuild
+        assert index.search("dragon") == [99]
+
+    async def test_search_index_concurrent_first_searches_build_once(self, db_session, monkeypatch):
+        """Test that searches racing on a cold index wait for a single build."""
+        db_session.add(Book(title="Dragons of Autumn", author="Weis", genre="Fantasy", year_published=1984))
+        await db_session.commit()
+        index = SearchIndex()
+        builds = []
+        rebuild = index._rebuild
+
+        async def counting_rebuild(db):
+            builds.append(db)
+            await rebuild(db)
+
+        monkeypatch.setattr(index, "_rebuild", counting_rebuild)
+        await asyncio.gather(*(index.ensure_built(db_session) for _ in range(3)))
+        assert len(builds) == 1
+
+    async def test_bulk_import_csv(self, client: AsyncClient, auth_headers: dict):
+        """Test a CSV import: valid rows inserted, bad rows reported, summaries deferred, list refreshed."""
+        before = await client.get("/books/", headers=auth_headers)
+        assert before.json() == []
+
+        csv_data = (
+            "title,author,genre,year_published,summary\n"
+            'Imported One,Author A,Fiction,2001,"A summary, with a comma"\n'
+            "Imported Two,Author B,,,\n"
+            ",Author C,Fiction,2003,Missing title\n"
+            "Imported Four,Author D,Fiction,not-a-year,Bad year\n"
+        )
+        response = await client.post(
+            "/books/import",
+            headers=auth_headers,
+            files={"file": ("catalog.csv", csv_data.encode(), "text/csv")}
+        )
+        assert response.status_code == 200
+        report = response.json()
+        assert report["imported"] == 2
+        assert report["failed"] == 2
+        assert report["pending_summaries"] == 1
+        assert [error["row"] for error in report["errors"]] == [3, 4]
+        assert "title" in report["errors"][0]["error"]
+
+        books = (await client.get("/books/", headers=auth_headers)).json()
+        assert [(book["title"], book["summary_status"]) for book in books] == [
+            ("Imported One", "ready"), ("Imported Two", "pending")
+        ]
+        assert books[0]["summary"] == "A summary, with a comma"
+
+    async def test_bulk_import_jsonl(self, client: AsyncClient, auth_headers: dict):
+        """Test a JSON Lines import with a malformed line and an unknown file type."""
+        jsonl_data = (
+            '{"title": "Json Book", "author": "Author", "genre": null, "year_published": 1999, "summary": "S"}\n'
+            "{not json}\n"
+        )
+        response = await client.post(
+            "/books/import",
+            headers=auth_headers,
+            files={"file": ("catalog.jsonl", jsonl_data.encode(), "application/x-ndjson")}
+        )
+        assert response.json()["imported"] == 1
+        assert response.json()["errors"][0]["row"] == 2
+
+        response = await client.post(
+            "/books/import",
+            headers=auth_headers,
+            files={"file": ("catalog.txt", b"", "text/plain")}
+        )
+        assert response.status_code == 400
+
     async def test_get_book_by_id(self, client: AsyncClient, test_book: Book, auth_headers: dict):
         """Test retrieving a specific book."""
         response = await client.get(f"/books/{test_book.id}", headers=auth_headers)
@@ -77,6 +274,43 @@ class TestBooks:
         data = response.json()
         assert data["title"] == "Updated Title"
 
+    async def test_get_book_after_update(self, client: AsyncClient, test_book: Book, auth_headers: dict):
+        """Test that the cached book is refreshed by an update."""
+        await client.get(f"/books/{test_book.id}", headers=auth_headers)
+        await client.put(
+            f"/books/{test_book.id}",
+            headers=auth_headers,
+            json={
+                "title": "Refreshed Title",
+                "author": test_book.author,
+                "genre": test_book.genre,
+                "year_published": test_book.year_published,
+                "summary": test_book.summary
+            }
+        )
+        response = await client.get(f"/books/{test_book.id}", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["title"] == "Refreshed Title"
+
+    async def test_get_book_conditional(self, client: AsyncClient, test_book: Book, auth_headers: dict):
+        """Test that a current ETag is answered with an empty 304, and that an update changes it."""
+        response = await client.get(f"/books/{test_book.id}", headers=auth_headers)
+        etag = response.headers["etag"]
+
+        response = await client.get(f"/books/{test_book.id}", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        await client.put(f"/books/{test_book.id}", headers=auth_headers, json={
+            "title": "New Title", "author": test_book.author, "genre": test_book.genre,
+            "year_published": test_book.year_published, "summary": test_book.summary
+        })
+        response = await client.get(f"/books/{test_book.id}", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["title"] == "New Title"
+        assert response.headers["etag"] != etag
+
     async def test_delete_book(self, client: AsyncClient, test_book: Book, auth_headers: dict):
         """Test deleting a book."""
         response = await client.delete(f"/books/{test_book.id}", headers=auth_headers)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+
+from app.schemas.schemas import BookCreate
+from app.services import ai_service, book_services
+from app.utility import redis_client
+from app.utility.local_cache import LocalCache, MISSING
+
+
+@pytest.mark.asyncio
+class TestGetOrCompute:
+
+    async def test_concurrent_misses_compute_once(self):
+        """Test that concurrent misses on the same key run compute() only once."""
+        key = f"test:{uuid.uuid4().hex}"
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.2)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(redis_client.get_or_compute(key, compute) for _ in range(10)))
+        await redis_client.cache_delete(key)
+
+        assert calls == 1
+        assert all(result == {"answer": 42} for result in results)
+
+    async def test_stale_value_served_during_rebuild(self):
+        """Test that callers losing the rebuild race get the stale copy instead of waiting."""
+        key = f"test:{uuid.uuid4().hex}"
+        expired = {"value": "stale", "delta": 0.0, "expires_at": time.time() - 1}
+        await redis_client.redis.set(key, json.dumps(expired), ex=60)
+        await redis_client.redis.set(f"lock:{key}", "someone-else", ex=10)
+
+        async def compute():
+            return "fresh"
+
+        result = await redis_client.get_or_compute(key, compute)
+        await redis_client.cache_delete(key)
+        await redis_client.cache_delete(f"lock:{key}")
+
+        assert result == "stale"
+
+
+
+@pytest.mark.asyncio
+class TestInvalidation:
+
+    async def test_read_through_fills_do_not_notify_peers(self, db_session, test_book):
+        """Test that only writes, not cold reads, tell the other workers to drop a book."""
+        pubsub = redis_client.redis.pubsub()
+        await pubsub.subscribe(redis_client.INVALIDATION_CHANNEL)
+        await redis_client.cache_delete(book_services.book_cache_key(test_book.id))
+        await pubsub.get_message(timeout=0.1)  # subscription confirmation
+        await pubsub.get_message(timeout=0.1)  # the delete above
+
+        await book_services.get_book_by_id(db_session, test_book.id)
+        await book_services.get_books_by_ids(db_session, [test_book.id, 9999])
+        await book_services.get_book_by_id(db_session, 9998)
+        assert await pubsub.get_message(timeout=0.1) is None
+
+        await book_services.update_book(db_session, test_book.id, BookCreate(
+            title="Renamed", author="Test Author", genre="Fiction", year_published=2024, summary="A test book"))
+        message = await pubsub.get_message(timeout=0.1)
+        assert message["data"].endswith(f":book:{test_book.id}")
+        await pubsub.aclose()
+
+class TestLocalCache:
+
+    def test_evicts_least_recently_used(self):
+        """Test that the oldest untouched entry is evicted when the cache is full."""
+        cache = LocalCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is MISSING
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entries_are_misses(self):
+        """Test that entries past their TTL are not served."""
+        cache = LocalCache(max_entries=2, ttl=0)
+        cache.set("a", 1)
+
+        assert cache.get("a") is MISSING
+        assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+class TestLLMCache:
+
+    async def test_identical_prompts_hit_cache(self, fake_llm):
+        """Test that a repeated prompt is answered without calling the LLM again."""
+        prompt = f"Prompt {uuid.uuid4().hex}"
+
+        first = await ai_service.generate_text(prompt)
+        second = await ai_service.generate_text(prompt)
+        other = await ai_service.generate_text(prompt, temperature=0.1)
+
+        assert first == second == "Summary #1"
+        assert other == "Summary #2"
+        assert fake_llm.calls == 2
+
+    async def test_errors_are_not_cached(self, fake_llm):
+        """Test that a failed call is retried instead of serving the cached error."""
+        prompt = f"Prompt {uuid.uuid4().hex}"
+        fake_llm.fail = True
+        assert (await ai_service.generate_text(prompt)).startswith("[CHATGROQ ERROR]")
+
+        fake_llm.fail = False
+        assert await ai_service.generate_text(prompt) == "Summary #2"
+        assert fake_llm.calls == 2
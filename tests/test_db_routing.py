@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.main import app
+from app.db import session as db_session_module
+from app.db.base import Base, RoutedSession
+from app.db.session import SessionRouter, ReadOnlySessionError, get_db
+from app.models.models import User, Book
+from app.api.routers.auth import get_password_hash
+
+
+@pytest_asyncio.fixture
+async def stand_ins(tmp_path, monkeypatch):
+    """A primary and a replica database (two SQLite files that are never synchronized)."""
+    factories = []
+    for name in ("primary", "replica"):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db", poolclass=NullPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, class_=RoutedSession, expire_on_commit=False)
+        async with factory() as session:
+            session.add(User(username="reader", email="reader@example.com",
+                             hashed_password=get_password_hash("password123"), role="user"))
+            session.add(Book(title=f"{name.title()} Book", author="Author", genre=None, year_published=None,
+                             summary="S"))
+            await session.commit()
+        factories.append((engine, factory))
+
+    (primary_engine, primary), (replica_engine, replica) = factories
+    router = SessionRouter(primary, [replica], sticky_seconds=0.5)
+    monkeypatch.setattr(db_session_module, "db_router", router)
+    # Use the real routing dependency instead of the single test database
+    override = app.dependency_overrides.pop(get_db, None)
+    yield router
+    if override is not None:
+        app.dependency_overrides[get_db] = override
+    await primary_engine.dispose()
+    await replica_engine.dispose()
+
+
+def titles(response) -> list:
+    return [json.loads(line)["title"] for line in response.text.splitlines()]
+
+
+@pytest.mark.asyncio
+class TestReplicaRouting:
+
+    async def test_reads_use_replica_until_client_writes(self, stand_ins):
+        """Test GETs served by the replica, writes by the primary, and read-your-writes after a commit."""
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            login = await client.post("/auth/login", data={"username": "reader@example.com",
+                                                           "password": "password123"})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+            # The export is never cached, so every read reaches a database
+            books = await client.get("/export/books", headers=headers)
+            assert titles(books) == ["Replica Book"]
+
+            created = await client.post("/books/", headers=headers, json={
+                "title": "New Book", "author": "Author", "genre": None, "year_published": None, "summary": "S"
+            })
+            assert created.status_code == 200
+
+            # Pinned to the primary: the new book is visible right away
+            books = await client.get("/export/books", headers=headers)
+            assert titles(books) == ["Primary Book", "New Book"]
+
+            await asyncio.sleep(0.6)
+            books = await client.get("/export/books", headers=headers)
+            assert titles(books) == ["Replica Book"]
+
+    async def test_replica_session_rejects_writes(self, stand_ins):
+        """Test that ORM writes through a replica session fail instead of silently diverging."""
+        async with stand_ins.replicas[0]() as session:
+            session.info["read_only"] = True
+            session.add(Book(title="Oops", author="Author", genre=None, year_published=None, summary="S"))
+            with pytest.raises(ReadOnlySessionError):
+                await session.flush()
+
+    async def test_shared_book_caches_filled_from_primary(self, stand_ins, db_session):
+        """Test that list and search pages cached by a replica read come from the primary, not the lagging replica."""
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            login = await client.post("/auth/login", data={"username": "reader@example.com",
+                                                           "password": "password123"})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+            books = await client.get("/books/", headers=headers)
+            assert [book["title"] for book in books.json()] == ["Primary Book"]
+            found = await client.get("/books/search", params={"q": "book"}, headers=headers)
+            assert [book["title"] for book in found.json()] == ["Primary Book"]
+            # Other reads of the same request type still use the replica
+            assert titles(await client.get("/export/books", headers=headers)) == ["Replica Book"]
+
+    async def test_review_page_etag_matches_replica_page(self, stand_ins, db_session):
+        """Test that a review page read from a lagging replica is not tagged with the primary's newer version."""
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            login = await client.post("/auth/login", data={"username": "reader@example.com",
+                                                           "password": "password123"})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            created = await client.post("/books/1/reviews", headers=headers,
+                                        json={"rating": 5, "review_text": "Only on the primary"})
+            assert created.status_code == 200
+
+            await asyncio.sleep(0.6)
+            page = await client.get("/books/1/reviews", headers=headers)
+            assert page.json() == []
+            assert page.headers["etag"] == '"reviews-1-v1"'
+            # The cached version is newer, so the stale copy is not confirmed with a 304
+            again = await client.get("/books/1/reviews", headers={**headers, "If-None-Match": page.headers["etag"]})
+            assert again.status_code == 200
@@ -0,0 +1,54 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.models.models import Book, Review
+
+
+def parse_ndjson(body: bytes) -> list:
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+@pytest.mark.asyncio
+class TestExport:
+
+    async def test_export_books_in_batches(self, client: AsyncClient, db_session, auth_headers: dict, monkeypatch):
+        """Test that the whole catalog is streamed across several cursor batches, gzipped on request."""
+        monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+        db_session.add_all([Book(title=f"Book {i}", author="Author", genre="Fiction", year_published=2000,
+                                 summary="S") for i in range(5)])
+        await db_session.commit()
+
+        response = await client.get("/export/books", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        books = parse_ndjson(response.content)
+        assert [book["title"] for book in books] == [f"Book {i}" for i in range(5)]
+        assert books[0]["updated_at"]
+
+        # httpx transparently decodes the gzip content encoding
+        gzipped = await client.get("/export/books", params={"gzip": True}, headers=auth_headers)
+        assert gzipped.headers["content-encoding"] == "gzip"
+        assert parse_ndjson(gzipped.content) == books
+
+    async def test_export_updated_since(self, client: AsyncClient, db_session, test_user, auth_headers: dict):
+        """Test that only rows written after `updated_since` are exported."""
+        old = datetime.utcnow() - timedelta(days=2)
+        books = [Book(title="Old", author="A", genre=None, year_published=None, summary="S", updated_at=old),
+                 Book(title="New", author="A", genre=None, year_published=None, summary="S")]
+        db_session.add_all(books)
+        await db_session.commit()
+        db_session.add_all([
+            Review(book_id=books[0].id, user_id=test_user.id, review_text="Old", rating=3, created_at=old),
+            Review(book_id=books[0].id, user_id=test_user.id, review_text="New", rating=5),
+        ])
+        await db_session.commit()
+
+        since = (datetime.utcnow() - timedelta(days=1)).isoformat()
+        response = await client.get("/export/books", params={"updated_since": since}, headers=auth_headers)
+        assert [book["title"] for book in parse_ndjson(response.content)] == ["New"]
+        response = await client.get("/export/reviews", params={"updated_since": since}, headers=auth_headers)
+        assert [review["review_text"] for review in parse_ndjson(response.content)] == ["New"]
@@ -0,0 +1,51 @@
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+
+def sample(name: str, **labels) -> float:
+    """Current value of a metric sample (0 if it has not been recorded yet)."""
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def book_cache_hits() -> float:
+    return sum(sample("cache_lookups_total", tier=tier, prefix="book", result="hit") for tier in ("l1", "redis"))
+
+
+@pytest.mark.asyncio
+class TestMetrics:
+
+    async def test_route_db_and_cache_metrics(self, client: AsyncClient, auth_headers: dict, test_book):
+        """Test that requests are recorded per route template, with their queries and cache lookups."""
+        route = {"method": "GET", "route": "/books/{book_id}"}
+        requests_before = sample("http_request_duration_seconds_count", status="2xx", **route)
+        queries_before = sample("http_request_db_queries_sum", **route)
+        hits_before = book_cache_hits()
+
+        for _ in range(2):
+            response = await client.get(f"/books/{test_book.id}", headers=auth_headers)
+            assert response.status_code == 200
+
+        assert sample("http_request_duration_seconds_count", status="2xx", **route) == requests_before + 2
+        assert sample("http_request_db_queries_sum", **route) > queries_before
+        # The second read is served from the cache (local tier or Redis, depending on settings)
+        assert book_cache_hits() > hits_before
+
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        # Labelled by template, never by the concrete path
+        assert 'route="/books/{book_id}"' in response.text
+        assert f'route="/books/{test_book.id}"' not in response.text
+
+    async def test_llm_metrics(self, client: AsyncClient, fake_llm):
+        """Test that LLM latency is observed for every call and failures are counted."""
+        calls_before = sample("llm_request_duration_seconds_count", operation="invoke")
+        errors_before = sample("llm_errors_total", operation="invoke")
+
+        await client.post("/generate-summary", json={"text": "Some text"})
+        fake_llm.fail = True
+        await client.post("/generate-summary", json={"text": "Other text"})
+
+        assert sample("llm_request_duration_seconds_count", operation="invoke") == calls_before + 2
+        assert sample("llm_errors_total", operation="invoke") == errors_before + 1
@@ -0,0 +1,112 @@
+import pytest
+from httpx import AsyncClient
+
+from app.models.models import Book, Review
+from app.services.book_services import get_books_by_ids
+from app.services import recommendation_services
+from app.services.recommendation_services import RecommendationEngine, build_model
+from helpers import assert_max_queries
+
+BOOKS = [
+    (1, "Fantasy", "Tolkien"),
+    (2, "Fantasy", "Tolkien"),
+    (3, "Fantasy", "Martin"),
+    (4, "Horror", "King"),
+]
+
+
+def make_engine(reviews):
+    engine = RecommendationEngine(top_k=10)
+    engine.model = build_model(BOOKS, reviews, top_k=10)
+    return engine
+
+
+class TestRecommendationEngine:
+
+    def test_recommends_books_liked_by_similar_users(self):
+        """Test that a user is recommended what users with the same taste liked."""
+        engine = make_engine([
+            (1, 1, 5), (1, 2, 5), (1, 4, 1),
+            (2, 1, 5), (2, 2, 4), (2, 4, 1),
+            (3, 1, 5),
+        ])
+
+        recommended = engine.recommend(user_id=3, limit=3)
+        assert recommended[0] == 2
+        assert 1 not in recommended
+
+    def test_filters_and_cold_start(self):
+        """Test genre/author post-filters and popularity ranking for unknown users."""
+        engine = make_engine([(1, 3, 5), (2, 3, 5), (1, 4, 2)])
+
+        assert engine.recommend(user_id=None, limit=1) == [3]
+        assert engine.recommend(user_id=None, genre="Horror") == [4]
+        assert engine.recommend(user_id=None, author="Tolkien") == [1, 2]
+
+    def test_new_rating_excluded_before_rebuild(self):
+        """Test that a book rated after the last rebuild is no longer recommended."""
+        engine = make_engine([(1, 1, 5), (1, 2, 5)])
+        engine.add_rating(2, 1, 5)
+
+        recommended = engine.recommend(user_id=2, limit=4)
+        assert 1 not in recommended
+        assert recommended[0] == 2
+
+
+@pytest.mark.asyncio
+class TestRecommendationsEndpoint:
+
+    async def test_personalized_recommendations(
+            self,
+            client: AsyncClient,
+            db_session,
+            test_user,
+            auth_headers: dict
+    ):
+        """Test that the endpoint ranks books and respects the genre filter."""
+        books = [Book(title=f"Book {i}", author="Author", genre=genre, year_published=2024, summary="S")
+                 for i, genre in enumerate(["Fiction", "Fiction", "Horror"])]
+        db_session.add_all(books)
+        await db_session.commit()
+        db_session.add(Review(book_id=books[0].id, user_id=test_user.id, review_text="Great", rating=5))
+        await db_session.commit()
+
+        response = await client.get("/recommendations", params={"genre": "Fiction"}, headers=auth_headers)
+        assert response.status_code == 200
+        ids = [book["id"] for book in response.json()]
+        assert ids == [books[1].id]
+
+    async def test_recommended_books_loaded_in_one_query(self, db_session):
+        """Test that the recommended books are read with one cache round trip and one query for the misses."""
+        books = [Book(title=f"Book {i}", author="Author", genre="Fiction", year_published=2024, summary="S")
+                 for i in range(5)]
+        db_session.add_all(books)
+        await db_session.commit()
+        book_ids = [book.id for book in reversed(books)] + [99999]
+
+        with assert_max_queries(1):
+            loaded = await get_books_by_ids(db_session, book_ids)
+        with assert_max_queries(0):
+            cached = await get_books_by_ids(db_session, book_ids)
+        assert [book["id"] for book in loaded] == [book["id"] for book in cached] == book_ids[:-1]
+
+    async def test_rating_during_rebuild_is_kept(self, db_session, test_user, monkeypatch):
+        """Test that a rating recorded while the model is being built is still folded in afterwards."""
+        books = [Book(title=f"Book {i}", author="Author", genre="Fiction", year_published=2024, summary="S")
+                 for i in range(2)]
+        db_session.add_all(books)
+        await db_session.commit()
+        db_session.add_all([Review(book_id=book.id, user_id=test_user.id, review_text="Great", rating=5)
+                            for book in books])
+        await db_session.commit()
+        engine = RecommendationEngine(top_k=10)
+
+        def build_while_rating(*args):
+            # Another request rates a book while the matrices are computed
+            engine.add_rating(999, books[0].id, 5)
+            return build_model(*args)
+
+        monkeypatch.setattr(recommendation_services, "build_model", build_while_rating)
+        await engine.rebuild(db_session)
+
+        assert engine.recommend(user_id=999) == [books[1].id]
@@ -1,7 +1,24 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
 import pytest
 from httpx import AsyncClient
 
-from app.models.models import Book
+from sqlalchemy import text
+
+from app.models.models import Book, Review
+from helpers import assert_max_queries, parse_sse
+from app.config import settings
+from app.services import ai_service, review_services
+from app.services.review_services import (
+    aggregated_rating,
+    get_rating_stats,
+    reconcile_rating_stats,
+    reviews_page_query,
+    summarize_reviews
+)
+from app.utility.rate_limiter import LLMGovernor, RateLimitExceeded
 
 
 @pytest.mark.asyncio
@@ -79,4 +96,234 @@ class TestReviews:
         data = response.json()
         assert isinstance(data, list)
 
+    async def test_list_reviews_paginated_and_sorted(
+            self,
+            client: AsyncClient,
+            db_session,
+            test_book: Book,
+            test_user,
+            auth_headers: dict
+    ):
+        """Test keyset pages newest first (ties broken by ID) and the best-rated-first order."""
+        now = datetime.utcnow()
+        # The last two reviews share a timestamp
+        times = [now - timedelta(hours=3), now - timedelta(hours=2), now, now]
+        for i, (created_at, rating) in enumerate(zip(times, [5, 2, 4, 3])):
+            db_session.add(Review(book_id=test_book.id, user_id=test_user.id, review_text=f"Review {i}",
+                                  rating=rating, created_at=created_at))
+        await db_session.commit()
+
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 3, **({"after": cursor} if cursor else {})}
+            response = await client.get(f"/books/{test_book.id}/reviews", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            pages.append([review["review_text"] for review in response.json()])
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert pages == [["Review 3", "Review 2", "Review 1"], ["Review 0"]]
+
+        first = await client.get(f"/books/{test_book.id}/reviews", params={"sort": "rating", "limit": 2},
+                                 headers=auth_headers)
+        second = await client.get(f"/books/{test_book.id}/reviews",
+                                  params={"sort": "rating", "limit": 2, "after": first.headers["X-Next-Cursor"]},
+                                  headers=auth_headers)
+        assert [review["rating"] for review in first.json() + second.json()] == [5, 4, 3, 2]
+
+        response = await client.get(f"/books/{test_book.id}/reviews", params={"after": "garbage"},
+                                    headers=auth_headers)
+        assert response.status_code == 400
+
+    async def test_list_reviews_conditional(self, client: AsyncClient, test_book: Book, auth_headers: dict):
+        """Test that an unchanged review page is answered with 304 from the cache, and a new review changes it."""
+        url = f"/books/{test_book.id}/reviews"
+        etag = (await client.get(url, headers=auth_headers)).headers["etag"]
+
+        with assert_max_queries(0):
+            response = await client.get(url, headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 304
+
+        await client.post(url, headers=auth_headers, json={"review_text": "Great", "rating": 5})
+        response = await client.get(url, headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert [review["review_text"] for review in response.json()] == ["Great"]
+        assert response.headers["etag"] != etag
+
+    async def test_review_page_uses_index(self, db_session, test_book: Book):
+        """Test that a review page is read through the (book_id, created_at, id) index, not a table scan."""
+        cursor = [datetime.utcnow(), 10]
+        query = reviews_page_query(test_book.id, "recent", cursor, limit=20)
+        sql = str(query.compile(dialect=db_session.bind.dialect, compile_kwargs={"literal_binds": True}))
+        if db_session.bind.dialect.name == "postgresql":
+            # Tiny test tables would always be scanned sequentially otherwise
+            await db_session.execute(text("SET LOCAL enable_seqscan = off"))
+            plan = "\n".join((await db_session.execute(text(f"EXPLAIN {sql}"))).scalars().all())
+        else:
+            plan = "\n".join(row[-1] for row in (await db_session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all())
+
+        assert "ix_reviews_book_id_created_at_id" in plan
+        # Rows come out of the index in order, without a separate sort step
+        assert "TEMP B-TREE" not in plan and "Sort" not in plan
+
+    async def test_rating_stats_updated_by_review(
+            self,
+            client: AsyncClient,
+            db_session,
+            test_book: Book,
+            auth_headers: dict
+    ):
+        """Test that adding reviews maintains the book's rating aggregate."""
+        for rating in (5, 3):
+            await client.post(
+                f"/books/{test_book.id}/reviews",
+                headers=auth_headers,
+                json={"rating": rating, "review_text": "Review"}
+            )
+
+        stats = await get_rating_stats(db_session, test_book.id)
+        assert stats.review_count == 2
+        assert stats.histogram() == {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1}
+        assert await aggregated_rating(db_session, test_book.id) == 4.0
+
+    async def test_reconcile_rating_stats(self, db_session, test_book: Book, test_user):
+        """Test rebuilding rating aggregates from the reviews table."""
+        for rating in (1, 2, 2):
+            db_session.add(Review(book_id=test_book.id, user_id=test_user.id, review_text="Review", rating=rating))
+        await db_session.commit()
+
+        assert await reconcile_rating_stats(db_session) == 1
+        stats = await get_rating_stats(db_session, test_book.id)
+        assert stats.review_count == 3
+        assert stats.rating_2 == 2
+        assert await aggregated_rating(db_session, test_book.id) == pytest.approx(5 / 3)
+
+    async def test_review_summary_resummarizes_only_last_chunk(self, fake_llm, monkeypatch):
+        """Test map-reduce summarization and that a new review only redoes the last chunk."""
+        monkeypatch.setattr(settings, "REVIEW_CHUNK_TOKENS", 30)
+        prefix = uuid.uuid4().hex
+        reviews = [f"{prefix} review {i} " + "x" * 8 for i in range(6)]
+
+        summary = await summarize_reviews(reviews)
+        # Two reviews fit per chunk: three chunk summaries plus one combining call
+        assert fake_llm.calls == 4
+        assert summary == "Summary #4"
+
+        await summarize_reviews(reviews + [f"{prefix} review 6 " + "x" * 8])
+        assert fake_llm.calls == 6
+
+    async def test_review_summary_reduces_partials_longer_than_chunk(self, fake_llm, monkeypatch):
+        """Test that the reduce rounds still converge when two partial summaries do not fit in a chunk."""
+        monkeypatch.setattr(settings, "REVIEW_CHUNK_TOKENS", 5)
+        prefix = uuid.uuid4().hex
+        reviews = [f"{i} {prefix}" for i in range(8)]
+
+        summary = await summarize_reviews(reviews)
+        # Eight single-review chunks, then partials paired up: 8 + 4 + 2 calls, plus the final one
+        assert fake_llm.calls == 15
+        assert summary == "Summary #15"
+
+    async def test_book_summary_streamed_rating_first(
+            self,
+            client: AsyncClient,
+            test_book: Book,
+            auth_headers: dict,
+            fake_llm
+    ):
+        """Test that the streamed book summary sends the rating before any generated text."""
+        await client.post(
+            f"/books/{test_book.id}/reviews",
+            headers=auth_headers,
+            json={"rating": 4, "review_text": "Nice book"}
+        )
+
+        response = await client.get(f"/books/{test_book.id}/summary", params={"stream": True}, headers=auth_headers)
+        assert response.status_code == 200
+        events = parse_sse(response.text)
+
+        assert events[0] == ("rating", {
+            "book_id": test_book.id,
+            "title": test_book.title,
+            "summary": test_book.summary,
+            "average_rating": 4.0,
+            "review_count": 1,
+            "rating_histogram": {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0},
+        })
+        assert "".join(data["text"] for event, data in events if event == "token") == "Summary #1"
+        assert events[-1][0] == "done"
+
+    async def test_book_summary_stream_admitted_before_response(
+            self,
+            client: AsyncClient,
+            test_book: Book,
+            auth_headers: dict,
+            fake_llm,
+            monkeypatch
+    ):
+        """Test that the streamed summary needs capacity before it starts, and cached answers give it back."""
+        monkeypatch.setattr(ai_service, "governor", LLMGovernor("llm:ratelimit:test", 2, 0, 1))
+        monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT", 0.1)
+        url = f"/books/{test_book.id}/summary"
+        await client.post(f"/books/{test_book.id}/reviews", headers=auth_headers,
+                          json={"rating": 4, "review_text": "Nice book"})
+
+        # The second and third requests are answered from the cache and hand their request back; the
+        # single call slot is released as each stream ends
+        for _ in range(3):
+            response = await client.get(url, params={"stream": True}, headers=auth_headers)
+            assert response.status_code == 200
+            assert "".join(data["text"] for event, data in parse_sse(response.text) if event == "token") == "Summary #1"
+
+        await client.post(f"/books/{test_book.id}/reviews", headers=auth_headers,
+                          json={"rating": 2, "review_text": "Too long"})
+        response = await client.get(url, params={"stream": True}, headers=auth_headers)
+        assert response.status_code == 200
+        # The budget is spent: refused with a status code rather than an error event in a 200
+        response = await client.get(url, params={"stream": True}, headers=auth_headers)
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert fake_llm.calls == 2
+
+    async def test_multi_chunk_summary_streams_with_one_call_slot(
+            self,
+            client: AsyncClient,
+            test_book: Book,
+            auth_headers: dict,
+            fake_llm,
+            monkeypatch
+    ):
+        """Test that a streamed summary whose reviews need a map phase does not wait on its own call slot."""
+        monkeypatch.setattr(ai_service, "governor", LLMGovernor("llm:ratelimit:test", 0, 0, 1))
+        monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT", 0.2)
+        monkeypatch.setattr(settings, "REVIEW_CHUNK_TOKENS", 10)
+        for i in range(3):
+            await client.post(f"/books/{test_book.id}/reviews", headers=auth_headers,
+                              json={"rating": 4, "review_text": f"{i} " + "long review " * 4})
+
+        response = await client.get(f"/books/{test_book.id}/summary", params={"stream": True}, headers=auth_headers)
+        assert response.status_code == 200
+        events = parse_sse(response.text)
+        assert [event for event, _ in events if event == "error"] == []
+        # Three chunk summaries, then the streamed final summary
+        assert "".join(data["text"] for event, data in events if event == "token") == "Summary #4"
+        assert fake_llm.calls == 4
+
+    async def test_review_chunks_cancelled_on_first_failure(self, monkeypatch):
+        """Test that a chunk summary running out of capacity stops the other chunk summaries."""
+        monkeypatch.setattr(settings, "REVIEW_CHUNK_TOKENS", 10)
+        cancelled = []
+
+        async def generate_text(prompt, max_tokens):
+            if "fail" in prompt:
+                raise RateLimitExceeded("LLM rate limit reached", retry_after=1.0)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(prompt)
+                raise
 
+        monkeypatch.setattr(review_services, "generate_text", generate_text)
+        with pytest.raises(RateLimitExceeded):
+            await asyncio.wait_for(summarize_reviews(["slow " * 8, "slower " * 6, "fail " * 8]), 1)
+        await asyncio.sleep(0)
+        assert len(cancelled) == 2
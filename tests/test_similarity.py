@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.models.models import Book
+from app.services.book_services import get_similar_books
+from app.services.similarity_index import SimilarityIndex, similarity_index
+from app.utility import redis_client
+from helpers import assert_max_queries
+
+BOOKS = [
+    (1, "The Hobbit", "Tolkien", "Fantasy", "A hobbit goes on a quest with dwarves to reclaim a dragon's treasure."),
+    (2, "The Fellowship of the Ring", "Tolkien", "Fantasy", "A hobbit sets out on a quest to destroy the ring."),
+    (3, "The Shining", "King", "Horror", "A family winters in an isolated haunted hotel."),
+    (4, "It", "King", "Horror", "A shape shifting clown haunts a small town."),
+]
+
+
+def make_index(path=None):
+    index = SimilarityIndex(dimensions=256, path=path)
+    vectors, book_ids, document_frequency = index._build_arrays(BOOKS)
+    index.vectors, index.book_ids, index.document_frequency = vectors, book_ids, document_frequency
+    index.rows = {int(book_id): row for row, book_id in enumerate(book_ids)}
+    index.built = True
+    return index
+
+
+class TestSimilarityIndex:
+
+    def test_ranks_by_content(self):
+        """Test that books sharing author, genre and vocabulary rank first."""
+        index = make_index()
+
+        assert index.similar(1, limit=1)[0][0] == 2
+        assert index.similar(3, limit=1)[0][0] == 4
+        assert all(book_id != 1 for book_id, _ in index.similar(1, limit=3))
+
+    def test_incremental_upsert_and_remove(self):
+        """Test that new and changed books are indexed without a rebuild, and removed books never match."""
+        index = make_index()
+        index.upsert(5, "Doctor Sleep", "King", "Horror", "The boy from the haunted hotel grows up.")
+        assert index.similar(5, limit=1)[0][0] == 3
+
+        index.upsert(4, "The Return of the King", "Tolkien", "Fantasy", "The hobbit quest to destroy the ring ends.")
+        assert index.similar(4, limit=1)[0][0] == 2
+
+        index.remove(2)
+        assert 2 not in [book_id for book_id, _ in index.similar(1, limit=4)]
+
+    def test_persisted_index_starts_warm(self, tmp_path):
+        """Test that a saved index is memory-mapped by a new instance and still accepts updates."""
+        make_index(str(tmp_path)).save()
+
+        index = SimilarityIndex(dimensions=256, path=str(tmp_path))
+        assert index.load()
+        assert index.similar(1, limit=1)[0][0] == 2
+        index.upsert(5, "Doctor Sleep", "King", "Horror", "The boy from the haunted hotel grows up.")
+        assert index.similar(5, limit=1)[0][0] == 3
+
+    def test_save_switches_generations_atomically(self, tmp_path):
+        """Test that each save is a complete new generation made current at once, keeping the previous one."""
+        index = make_index(str(tmp_path))
+        for _ in range(3):
+            index.save()
+        index.upsert(5, "Doctor Sleep", "King", "Horror", "The boy from the haunted hotel grows up.")
+        index.save()
+
+        assert len(list((tmp_path / "generations").iterdir())) == 2
+        loaded = SimilarityIndex(dimensions=256, path=str(tmp_path))
+        assert loaded.load()
+        assert list(loaded.book_ids) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.asyncio
+class TestSimilarBooksEndpoint:
+
+    async def test_similar_books(self, client: AsyncClient, db_session, auth_headers: dict):
+        """Test the endpoint, including a book created after the index was built."""
+        books = [Book(title=title, author=author, genre=genre, year_published=2000, summary=summary)
+                 for _, title, author, genre, summary in BOOKS]
+        db_session.add_all(books)
+        await db_session.commit()
+
+        response = await client.get(f"/books/{books[0].id}/similar", params={"limit": 2}, headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data[0]["id"] == books[1].id
+        assert data[0]["similarity"] > 0
+
+        # Every neighbour comes from one cache round trip plus at most one query for the misses
+        with assert_max_queries(1):
+            assert len(await get_similar_books(db_session, books[0].id, limit=3)) >= 2
+
+        created = await client.post("/books/", json={
+            "title": "Doctor Sleep", "author": "King", "genre": "Horror", "year_published": 2013,
+            "summary": "The boy from the haunted hotel grows up."
+        }, headers=auth_headers)
+        response = await client.get(f"/books/{created.json()['id']}/similar", headers=auth_headers)
+        assert response.json()[0]["id"] == books[2].id
+
+        response = await client.get("/books/9999/similar", headers=auth_headers)
+        assert response.status_code == 404
+
+    async def test_concurrent_first_queries_build_once(self, db_session, monkeypatch):
+        """Test that requests racing on a cold index wait for a single build."""
+        db_session.add(Book(title="The Hobbit", author="Tolkien", genre="Fantasy", year_published=1937))
+        await db_session.commit()
+        index = SimilarityIndex(dimensions=256)
+        builds = []
+        rebuild = index._rebuild
+
+        async def counting_rebuild(db):
+            builds.append(db)
+            await rebuild(db)
+
+        monkeypatch.setattr(index, "_rebuild", counting_rebuild)
+        await asyncio.gather(*(index.ensure_built(db_session) for _ in range(3)))
+        assert len(builds) == 1
+
+    async def test_books_written_by_other_workers_are_synced(self, db_session):
+        """Test that a book another worker wrote reaches this worker's index through the invalidation channel."""
+        db_session.add(Book(title="The Hobbit", author="Tolkien", genre="Fantasy", year_published=1937,
+                            summary="A hobbit joins dwarves on a quest for a dragon's gold."))
+        await db_session.commit()
+        await similarity_index.ensure_built(db_session)
+
+        # Another worker inserts a book and announces its cache entry
+        book = Book(title="The Silmarillion", author="Tolkien", genre="Fantasy", year_published=1977,
+                    summary="Elves and the dragon wars of the First Age.")
+        db_session.add(book)
+        await db_session.commit()
+        redis_client._handle_invalidation(f"otherworker:book:{book.id}")
+        # Our own messages are ignored
+        redis_client._handle_invalidation(f"{redis_client._WORKER_ID}:book:1")
+
+        with assert_max_queries(1):
+            await similarity_index.sync(db_session)
+        assert book.id in similarity_index.rows
+
+        await db_session.delete(book)
+        await db_session.commit()
+        redis_client._handle_invalidation(f"otherworker:book:{book.id}")
+        await similarity_index.sync(db_session)
+        assert book.id not in similarity_index.rows
+
+    async def test_write_during_rebuild_query_survives(self, db_session):
+        """Test that a book written while the rebuild reads the books table makes it into the new arrays."""
+        db_session.add(Book(title="The Hobbit", author="Tolkien", genre="Fantasy", year_published=1937))
+        await db_session.commit()
+        index = SimilarityIndex(dimensions=256)
+        await index.rebuild(db_session)
+
+        class WriteDuringQuery:
+            async def execute(self, statement):
+                result = await db_session.execute(statement)
+                # Another request saves a book while the query is in flight
+                index.upsert(99, "The Silmarillion", "Tolkien", "Fantasy", "Elves and dragons.")
+                return result
+
+        await index.rebuild(WriteDuringQuery())
+        assert 99 in index.rows
@@ -0,0 +1,57 @@
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.models.models import Book
+from app.services import book_services
+from app.utility.sql_profiler import profile_queries
+
+from helpers import assert_max_queries
+
+
+@pytest.mark.asyncio
+class TestSqlProfiler:
+
+    async def test_query_budget(self, client: AsyncClient, auth_headers: dict, test_book: Book):
+        """Test the per-endpoint query budget helper, and that cache hits cost no query at all."""
+        with assert_max_queries(2):
+            response = await client.get(f"/books/{test_book.id}", headers=auth_headers)
+        assert response.status_code == 200
+
+        with assert_max_queries(0):
+            await client.get(f"/books/{test_book.id}", headers=auth_headers)
+
+        with pytest.raises(pytest.fail.Exception, match="at most 0 SQL statements"):
+            with assert_max_queries(0):
+                await client.get(f"/books/{test_book.id + 1}", headers=auth_headers)
+
+    async def test_repeated_statements_flagged(self, db_session):
+        """Test that a lookup per row is reported as one repeated statement with its calling function."""
+        books = [Book(title=f"Book {i}", author="Author", genre=None, year_published=None, summary="S")
+                 for i in range(3)]
+        db_session.add_all(books)
+        await db_session.commit()
+
+        with profile_queries() as profile:
+            for book in books:
+                await book_services.get_book_by_id(db_session, book.id)
+
+        [repeated] = profile.repeated(threshold=3)
+        assert repeated["count"] == 3
+        assert repeated["distinct_parameters"] == 3
+        assert repeated["callers"] == ["app/services/book_services.py:fetch_book"]
+
+    async def test_profile_header_and_debug_endpoint(self, client: AsyncClient, auth_headers: dict,
+                                                     test_book: Book, monkeypatch):
+        """Test the summary header and the recorded profile while profiling is on."""
+        response = await client.get("/debug/sql-profiles")
+        assert response.status_code == 404
+
+        monkeypatch.setattr(settings, "SQL_PROFILING", True)
+        response = await client.get(f"/books/{test_book.id}", headers=auth_headers)
+        assert response.headers["x-sql-profile"].startswith("queries=")
+
+        profiles = (await client.get("/debug/sql-profiles")).json()
+        latest = next(profile for profile in profiles if profile["label"] == "GET /books/{book_id}")
+        assert latest["query_count"] >= 1
+        assert all(query["caller"] != "unknown" for query in latest["queries"])
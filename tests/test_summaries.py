@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.services import ai_service, summary_jobs
+from app.utility.job_queue import RedisJobQueue
+from app.utility.rate_limiter import ConcurrencyExhausted, LLMGovernor, RateLimitExceeded
+from helpers import parse_sse
+
+
+@pytest.mark.asyncio
+class TestSummaryBatch:
+
+    async def test_batch_summaries_deduplicated(self, client: AsyncClient, fake_llm):
+        """Test that every input gets a result line and duplicates are summarized once."""
+        response = await client.post(
+            "/generate-summary/batch",
+            json={"texts": ["First text", "Second text", "First text"]}
+        )
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert sorted(line["index"] for line in lines) == [0, 1, 2]
+        by_index = {line["index"]: line["summary"] for line in lines}
+        assert by_index[0] == by_index[2]
+        assert fake_llm.calls == 2
+
+    async def test_batch_rejects_empty_input(self, client: AsyncClient):
+        """Test that an empty batch is rejected."""
+        response = await client.post("/generate-summary/batch", json={"texts": []})
+        assert response.status_code == 422
+
+    async def test_generate_summary_streamed(self, client: AsyncClient, fake_llm):
+        """Test that a streamed summary arrives as token events followed by done."""
+        response = await client.post("/generate-summary", params={"stream": True}, json={"text": "Some text"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.text)
+
+        assert events[-1][0] == "done"
+        assert "".join(data["text"] for event, data in events if event == "token") == "Summary #1"
+
+
+@pytest.mark.asyncio
+class TestLLMAdmission:
+
+    async def test_rate_limit_returns_429(self, client: AsyncClient, fake_llm, monkeypatch):
+        """Test that calls beyond the shared per-minute budget get a 429 instead of an error summary."""
+        monkeypatch.setattr(ai_service, "governor", LLMGovernor("llm:ratelimit:test", 2, 0, 4))
+        monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT", 0.1)
+
+        for text in ("First", "Second"):
+            response = await client.post("/generate-summary", json={"text": text})
+            assert response.status_code == 200
+        response = await client.post("/generate-summary", json={"text": "Third"})
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert fake_llm.calls == 2
+
+        # Cached answers need no capacity
+        response = await client.post("/generate-summary", json={"text": "First"})
+        assert response.status_code == 200
+
+    async def test_streamed_summary_refused_before_response(self, client: AsyncClient, fake_llm, monkeypatch):
+        """Test that a streamed summary without capacity gets a 429 instead of an error event in a 200."""
+        monkeypatch.setattr(ai_service, "governor", LLMGovernor("llm:ratelimit:test", 1, 0, 4))
+        monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT", 0.1)
+
+        response = await client.post("/generate-summary", params={"stream": True}, json={"text": "First"})
+        assert response.status_code == 200
+        response = await client.post("/generate-summary", params={"stream": True}, json={"text": "Second"})
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert response.headers["content-type"] == "application/json"
+        assert fake_llm.calls == 1
+
+    async def test_busy_slots_time_out(self):
+        """Test that a caller queued behind busy call slots gives up at its deadline."""
+        governor = LLMGovernor("llm:ratelimit:test", 0, 0, 1)
+        async with governor.slot(10, timeout=1):
+            with pytest.raises(ConcurrencyExhausted):
+                async with governor.slot(10, timeout=0.05):
+                    pass
+        async with governor.slot(10, timeout=0.05):
+            pass
+
+    async def test_summary_without_capacity_is_not_stored(self, db_session, test_book, fake_llm, monkeypatch):
+        """Test that a summary job without LLM capacity raises (to be deferred) and leaves the book pending."""
+        test_book.summary, test_book.summary_status = None, "pending"
+        await db_session.commit()
+        monkeypatch.setattr(ai_service, "governor", LLMGovernor("llm:ratelimit:test", 1, 0, 4))
+        monkeypatch.setattr(settings, "LLM_BACKGROUND_QUEUE_TIMEOUT", 0.1)
+        # The provider told a worker to back off for a minute
+        await ai_service.governor.penalize(60)
+
+        with pytest.raises(RateLimitExceeded) as error:
+            await summary_jobs.summarize_book(db_session, test_book.id)
+        assert error.value.retry_after > 50
+
+        await db_session.refresh(test_book)
+        assert (test_book.summary, test_book.summary_status) == (None, "pending")
+        assert fake_llm.calls == 0
+
+
+@pytest.mark.asyncio
+class TestSummaryQueue:
+
+    async def test_unacknowledged_job_is_handed_out_again(self, db_session):
+        """Test that a job whose worker died comes back after its lease, and that duplicates are merged."""
+        queue = RedisJobQueue("test")
+        queue.lease_seconds, queue.poll_interval = 0.05, 0.01
+        assert await queue.put_many([{"id": "book:1", "book_id": 1}, {"id": "book:1", "book_id": 1}]) == 1
+
+        job = await asyncio.wait_for(queue.get(), 1)
+        # The worker never acknowledges it, e.g. it crashed
+        assert await asyncio.wait_for(queue.get(), 1) == job
+
+        await queue.ack(job)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.get(), 0.2)
+
+    async def test_failed_job_is_retried_from_redis(self, db_session, monkeypatch):
+        """Test that a failed job's retry, with its attempt count, is kept in Redis rather than in a task."""
+        async def failing_summarize(db, book_id):
+            raise RuntimeError("upstream unavailable")
+
+        monkeypatch.setattr(summary_jobs, "summarize_book", failing_summarize)
+        monkeypatch.setattr(settings, "SUMMARY_RETRY_BACKOFF", 0.01)
+        monkeypatch.setattr(summary_jobs.summary_queue, "poll_interval", 0.01)
+
+        await summary_jobs.enqueue_summary(7)
+        await summary_jobs.process_summary_job(await asyncio.wait_for(summary_jobs.summary_queue.get(), 1))
+
+        retried = await asyncio.wait_for(summary_jobs.summary_queue.get(), 1)
+        assert (retried["book_id"], retried["attempt"]) == (7, 1)